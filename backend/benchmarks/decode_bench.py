@@ -0,0 +1,323 @@
+"""
+解碼效能基準測試 (rule_logic / decode API)。
+
+以可設定的深度、分支數、OPTION 數量與 INPUT/SERIAL 比例產生合成規則樹，
+寫入本機 SQLite，再把「正常」與「刁難」兩組代碼分別送進:
+- engine: 直接呼叫 decode_code / attempt_decode_chain (已編譯的規則樹)
+- api:    透過 Flask test client 呼叫 POST /api/v1/coding-rules/decode
+
+回報 codes/sec、p50/p99 延遲、每次解碼的 SQL 數量與峰值記憶體，
+並可存成 baseline JSON，之後用 --compare 比較是否退步。
+
+用法 (於 backend/ 目錄):
+    python -m benchmarks.decode_bench --rules 20 --depth 4 --fanout 3
+    python -m benchmarks.decode_bench --save-baseline benchmarks/baseline.json
+    python -m benchmarks.decode_bench --compare benchmarks/baseline.json
+"""
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy import event
+
+from src import create_app
+from src.config import Config
+from src.extensions import db
+from src.models.coding_rule import CodingNode, CodingRule
+from src.utils.rule_cache import clear_cache, get_root_index
+from src.utils.rule_logic import decode_code
+
+VALUE_SAMPLES = ['4K7', '1R0', '102', '2M2', '04U7', 'R010', '100', '3N3', '1P5', '680']
+
+# 比較 baseline 時，超過此比例視為退步
+DEFAULT_THRESHOLD = 0.15
+
+
+def _bench_config(db_path, result_cache):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+        SECRET_KEY = Config.SECRET_KEY or 'benchmark-secret-key-not-for-production'
+        JWT_SECRET_KEY = Config.JWT_SECRET_KEY or 'benchmark-secret-key-not-for-production'
+        DECODE_CACHE_ENABLED = result_cache
+    return BenchConfig
+
+
+# ---------- 合成規則樹 ----------
+
+def _random_code(rng, length, alphabet=string.ascii_uppercase + string.digits):
+    return ''.join(rng.choice(alphabet) for _ in range(length))
+
+
+def _add_level(rng, rule, parent, depth, args):
+    """在 parent 下產生一層節點，遞迴到指定深度"""
+    if depth == 0:
+        return
+    for order in range(args.fanout):
+        roll = rng.random()
+        if roll < args.input_ratio:
+            node_type = rng.choice(['INPUT', 'SERIAL'])
+            length = 3 if node_type == 'INPUT' else rng.randint(2, 4)
+            node = CodingNode(rule=rule, parent=parent, name=f'Resistance {depth}-{order}' if node_type == 'INPUT' else f'Serial {depth}-{order}',
+                              node_type=node_type, segment_length=length, sort_order=order)
+        elif roll < args.input_ratio + 0.15:
+            code = _random_code(rng, rng.randint(1, 2))
+            node = CodingNode(rule=rule, parent=parent, name=f'Fixed {code}', node_type='FIXED',
+                              segment_length=len(code), code=code, sort_order=order)
+        else:
+            length = rng.randint(1, 3)
+            node = CodingNode(rule=rule, parent=parent, name=f'Static {depth}-{order}', node_type='STATIC',
+                              segment_length=length, sort_order=order)
+            for code in {_random_code(rng, length) for _ in range(args.options)}:
+                CodingNode(rule=rule, parent=node, name=f'Option {code}', node_type='OPTION',
+                           segment_length=length, code=code)
+        _add_level(rng, rule, node, depth - 1, args)
+
+
+def _add_overlap_rule(depth):
+    """
+    刁難用規則: 每層是一個 STATIC 節點，OPTION 為 "1"、"11"、"111" 互為前綴，
+    最後以 FIXED "#" 結尾。全是 "1" 但缺少 "#" 的代碼會讓沒有記憶化的搜尋
+    嘗試 3^depth 種切法；記憶化後只需 depth × 代碼長度。
+    """
+    rule = CodingRule(name='Adversarial overlap', total_length=depth * 3 + 1)
+    parent = None
+    for level in range(depth):
+        node = CodingNode(rule=rule, parent=parent, name=f'Overlap {level}', node_type='STATIC',
+                          segment_length=1, sort_order=0)
+        for code in ('1', '11', '111'):
+            CodingNode(rule=rule, parent=node, name=f'Run {code}', node_type='OPTION',
+                       segment_length=len(code), code=code)
+        parent = node
+    CodingNode(rule=rule, parent=parent, name='Terminator', node_type='FIXED', segment_length=1, code='#')
+    db.session.add(rule)
+    return rule
+
+
+def build_catalog(args):
+    rng = random.Random(args.seed)
+    rules = []
+    for i in range(args.rules):
+        rule = CodingRule(name=f'Synthetic {i}', total_length=32)
+        root = CodingNode(rule=rule, name=f'Root {i}', node_type='FIXED', segment_length=2,
+                          code=_random_code(rng, 2, string.ascii_uppercase))
+        _add_level(rng, rule, root, args.depth, args)
+        db.session.add(rule)
+        rules.append(rule)
+    overlap = _add_overlap_rule(args.overlap_depth)
+    db.session.commit()
+    return rules, overlap
+
+
+# ---------- 代碼產生 ----------
+
+def _walk(rng, node):
+    """沿著已編譯的規則樹隨機走到葉節點，產生一個合法代碼"""
+    if node.node_type == 'STATIC':
+        if not node.options:
+            return None
+        part = rng.choice(node.options).code
+    elif node.node_type == 'FIXED':
+        part = node.code
+    elif node.node_type == 'INPUT':
+        sample = rng.choice(VALUE_SAMPLES)
+        part = (sample * node.segment_length)[:node.segment_length]
+    else:
+        part = ''.join(rng.choice(string.digits) for _ in range(node.segment_length))
+    if not node.children:
+        return part
+    rest = _walk(rng, rng.choice(node.children))
+    return None if rest is None else part + rest
+
+
+def generate_codes(args, rule_ids):
+    rng = random.Random(args.seed + 1)
+    roots = [root for rule_id in rule_ids for root in get_root_index(rule_id).roots]
+    realistic = []
+    while len(realistic) < args.codes:
+        code = _walk(rng, rng.choice(roots))
+        if code:
+            realistic.append(code)
+
+    adversarial = []
+    for code in realistic[:args.codes // 2]:
+        # 近似錯誤: 最後一個字元改成不可能的字元，迫使搜尋走到最深才失敗
+        adversarial.append(code[:-1] + '~')
+    while len(adversarial) < args.codes:
+        # 重疊規則: 一串 "1" 但結尾不是 '#'，每種切法都要到最後才失敗
+        adversarial.append('1' * rng.randint(args.overlap_depth, args.overlap_depth * 2) + '!')
+    rng.shuffle(adversarial)
+    return {"realistic": realistic, "adversarial": adversarial}
+
+
+# ---------- 量測 ----------
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+def _run(codes, decode_one, sql_counter):
+    latencies = []
+    successes = 0
+    sql_counter[0] = 0
+    started = time.perf_counter()
+    for code in codes:
+        t0 = time.perf_counter()
+        if decode_one(code):
+            successes += 1
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+    sql = sql_counter[0]
+
+    # 第二次執行只量測峰值記憶體 (tracemalloc 會拖慢速度，不與計時混在一起)
+    tracemalloc.start()
+    for code in codes:
+        decode_one(code)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "codes": len(codes),
+        "success_rate": round(successes / len(codes), 4) if codes else 0.0,
+        "codes_per_sec": round(len(codes) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 50), 4),
+        "p99_ms": round(_percentile(latencies, 99), 4),
+        "sql_per_decode": round(sql / len(codes), 4) if codes else 0.0,
+        "peak_kib": round(peak / 1024, 1)
+    }
+
+
+def run_benchmark(args):
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='decode-bench-'), 'bench.db')
+    app = create_app(_bench_config(db_path, args.result_cache))
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        clear_cache()
+
+        t0 = time.perf_counter()
+        rules, _ = build_catalog(args)
+        build_s = time.perf_counter() - t0
+        node_count = CodingNode.query.count()
+
+        sql_counter = [0]
+
+        def count_sql(*_):
+            sql_counter[0] += 1
+        event.listen(db.engine, 'before_cursor_execute', count_sql)
+
+        # 暖機: 編譯規則樹 (之後的解碼不應再查詢資料庫)
+        t0 = time.perf_counter()
+        clear_cache()
+        get_root_index()
+        compile_ms = (time.perf_counter() - t0) * 1000
+
+        code_sets = generate_codes(args, [r.id for r in rules])
+        client = app.test_client()
+
+        def engine_decode(code):
+            return decode_code(code, get_root_index().candidates(code)) is not None
+
+        def api_decode(code):
+            response = client.post('/api/v1/coding-rules/decode', json={"code": code})
+            return response.status_code == 200
+
+        results = {}
+        for scenario, codes in code_sets.items():
+            results[scenario] = {
+                "engine": _run(codes, engine_decode, sql_counter),
+                "api": _run(codes[:args.api_codes], api_decode, sql_counter)
+            }
+
+        event.remove(db.engine, 'before_cursor_execute', count_sql)
+
+    return {
+        "params": {
+            "rules": args.rules, "depth": args.depth, "fanout": args.fanout,
+            "options": args.options, "input_ratio": args.input_ratio,
+            "overlap_depth": args.overlap_depth, "codes": args.codes,
+            "api_codes": args.api_codes, "seed": args.seed, "result_cache": args.result_cache
+        },
+        "catalog": {"nodes": node_count, "build_s": round(build_s, 3), "compile_ms": round(compile_ms, 3)},
+        "results": results
+    }
+
+
+def compare(report, baseline, threshold):
+    """回傳退步項目的描述列表"""
+    regressions = []
+    for scenario, targets in report["results"].items():
+        for target, current in targets.items():
+            before = baseline.get("results", {}).get(scenario, {}).get(target)
+            if not before:
+                continue
+            if before["codes_per_sec"] and current["codes_per_sec"] < before["codes_per_sec"] * (1 - threshold):
+                regressions.append(f"{scenario}/{target}: codes/sec {before['codes_per_sec']} -> {current['codes_per_sec']}")
+            if before["p99_ms"] and current["p99_ms"] > before["p99_ms"] * (1 + threshold):
+                regressions.append(f"{scenario}/{target}: p99 {before['p99_ms']}ms -> {current['p99_ms']}ms")
+            if current["sql_per_decode"] > before["sql_per_decode"]:
+                regressions.append(f"{scenario}/{target}: SQL/decode {before['sql_per_decode']} -> {current['sql_per_decode']}")
+    return regressions
+
+
+def print_report(report):
+    catalog = report["catalog"]
+    print(f"catalog: {catalog['nodes']} nodes, built in {catalog['build_s']}s, compiled in {catalog['compile_ms']}ms")
+    print(f"{'scenario':<12} {'target':<7} {'codes/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'SQL/dec':>8} {'peak KiB':>9} {'ok':>6}")
+    for scenario, targets in report["results"].items():
+        for target, r in targets.items():
+            print(f"{scenario:<12} {target:<7} {r['codes_per_sec']:>10} {r['p50_ms']:>9} {r['p99_ms']:>9} "
+                  f"{r['sql_per_decode']:>8} {r['peak_kib']:>9} {r['success_rate']:>6}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Decode throughput benchmark with synthetic rule trees')
+    parser.add_argument('--rules', type=int, default=20, help='number of synthetic rules')
+    parser.add_argument('--depth', type=int, default=4, help='levels below each root')
+    parser.add_argument('--fanout', type=int, default=3, help='children per node')
+    parser.add_argument('--options', type=int, default=8, help='OPTION children per STATIC node')
+    parser.add_argument('--input-ratio', type=float, default=0.3, help='share of INPUT/SERIAL nodes')
+    parser.add_argument('--overlap-depth', type=int, default=18, help='levels of the adversarial overlap rule')
+    parser.add_argument('--codes', type=int, default=5000, help='codes per scenario for the engine run')
+    parser.add_argument('--api-codes', type=int, default=1000, help='codes per scenario sent through the API')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--db', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--result-cache', action='store_true', help='keep the decode result cache enabled')
+    parser.add_argument('--save-baseline', metavar='PATH', help='write the report as a baseline JSON')
+    parser.add_argument('--compare', metavar='PATH', help='compare against a baseline JSON')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='allowed regression ratio')
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args)
+    print_report(report)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print("REGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("no regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
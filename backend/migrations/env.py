@@ -97,14 +97,28 @@ def run_migrations_online():
     connectable = get_engine()
 
     with connectable.connect() as connection:
+        # 應用程式在 SQLite 上開啟了外鍵檢查 (src/extensions.py)；batch_alter_table 會重建資料表並
+        # DROP 原表，被其他表參照時 (例如 coding_node_closure -> coding_nodes) 會失敗，遷移期間關閉。
+        # PRAGMA 在交易中無效，必須在 begin_transaction 之前執行
+        sqlite = connection.dialect.name == 'sqlite'
+        if sqlite:
+            connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+            # 結束 SQLAlchemy 自動開始的交易，否則 alembic 不會 commit 遷移
+            connection.commit()
+
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
             **conf_args
         )
 
-        with context.begin_transaction():
-            context.run_migrations()
+        try:
+            with context.begin_transaction():
+                context.run_migrations()
+        finally:
+            if sqlite:
+                connection.exec_driver_sql('PRAGMA foreign_keys=ON')
+                connection.commit()
 
 
 if context.is_offline_mode():
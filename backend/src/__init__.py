@@ -1,7 +1,7 @@
-from flask import Flask
+from flask import Flask, jsonify
 from flask_cors import CORS
 from src.config import Config
-from src.extensions import db, migrate, cors, jwt
+from src.extensions import db, migrate, cors, jwt, decode_cache, blocklist_cache, login_limiter, password_hasher
 
 def create_app(config_class=Config):
     app = Flask(__name__)
@@ -13,6 +13,10 @@ def create_app(config_class=Config):
     # 設定 CORS，允許前端存取並攜帶 Cookie (supports_credentials=True)
     cors.init_app(app, resources={r"/api/*": {"origins": ["http://localhost:5173", "http://127.0.0.1:5173"]}}, supports_credentials=True)
     jwt.init_app(app)
+    decode_cache.init_app(app)
+    blocklist_cache.init_app(app)
+    login_limiter.init_app(app)
+    password_hasher.init_app(app)
 
     # 註冊UserModel
     from src.models.user import User
@@ -21,7 +25,7 @@ def create_app(config_class=Config):
     from src.models.token_blocklist import TokenBlocklist
 
     # 註冊CodingRule Model
-    from src.models.coding_rule import CodingRule, CodingNode
+    from src.models.coding_rule import CodingRule, CodingNode, CodingNodeClosure, CodingRuleVersion
 
     # 註冊路由
     from src.routes.auth import auth_bp
@@ -34,12 +38,28 @@ def create_app(config_class=Config):
     app.register_blueprint(coding_rules_bp, url_prefix='/api/v1/coding-rules')
 
     # 註冊flask cli命令
-    from src.commands import create_admin
+    from src.commands import create_admin, import_rule_command, export_rule_command, prune_blocklist_command
     app.cli.add_command(create_admin)
+    app.cli.add_command(import_rule_command)
+    app.cli.add_command(export_rule_command)
+    app.cli.add_command(prune_blocklist_command)
 
     # 註冊JWT檢查邏輯，確保被封鎖的Token無法使用
     import src.utils.jwt_check
 
+    # 密碼雜湊工作池已滿或逾時 (PasswordHashUnavailable)，統一回傳 503 請前端稍後重試
+    from src.utils.password_hasher import PasswordHashUnavailable
+
+    @app.errorhandler(PasswordHashUnavailable)
+    def password_hash_unavailable(e):
+        db.session.rollback()
+        app.logger.warning(f"Password hashing unavailable: {str(e)}")
+        return jsonify({"message": "Server is busy, please try again later"}), 503, {"Retry-After": "1"}
+
+    # 啟動過期黑名單紀錄的背景清理 (JWT_BLOCKLIST_SWEEP_SECONDS > 0 時)
+    from src.services.token_blocklist import start_sweeper
+    start_sweeper(app)
+
     
 
     return app
\ No newline at end of file
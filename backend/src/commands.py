@@ -1,3 +1,4 @@
+import json
 import click
 from flask.cli import with_appcontext
 from src.extensions import db
@@ -26,4 +27,123 @@ def create_admin(username, password):
     db.session.add(user)
     db.session.commit()
     
-    click.echo(f'✅ Successfully created Superuser: {username}')
\ No newline at end of file
+    click.echo(f'✅ Successfully created Superuser: {username}')
+
+@click.command('import-rule')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--name', help='新規則名稱 (未指定 --rule-id 時必填，JSON 檔內的 rule.name 亦可)')
+@click.option('--total-length', type=int, help='新規則總長度 (預設 16)')
+@click.option('--rule-id', type=int, help='匯入至既有規則')
+@click.option('--format', 'fmt', type=click.Choice(['json', 'csv', 'snapshot']), help='檔案格式 (預設依檔案內容與副檔名判斷)')
+@with_appcontext
+def import_rule_command(path, name, total_length, rule_id, fmt):
+    """從 JSON、CSV 或快照 (.crsnap) 批次匯入規則樹 (單一交易，全部成功或全部不寫入)"""
+    from flask import current_app
+    from src.models.coding_rule import CodingRule
+    from src.services.rule_import import prepare_import, validate_import, validate_rule_data, import_rule, RuleImportError, MAX_REPORTED_ERRORS
+    from src.utils.rule_cache import invalidate_rule
+    from src.utils.rule_snapshot import MAGIC, read_snapshot, snapshot_to_import_nodes, SnapshotError
+
+    if fmt is None:
+        with open(path, 'rb') as f:
+            is_snapshot = f.read(len(MAGIC)) == MAGIC
+        fmt = 'snapshot' if is_snapshot else ('csv' if path.lower().endswith('.csv') else 'json')
+    max_nodes = current_app.config['RULE_IMPORT_MAX_NODES']
+
+    rule_data = {k: v for k, v in (("name", name), ("total_length", total_length)) if v is not None}
+    if fmt == 'snapshot':
+        try:
+            with open(path, 'rb') as f:
+                rule, nodes = read_snapshot(f, max_nodes=max_nodes)
+        except SnapshotError as e:
+            click.echo(f'Error: invalid snapshot: {e}')
+            raise SystemExit(1)
+        rule_data = {"name": rule.name, "total_length": rule.total_length, "is_active": rule.is_active, **rule_data}
+        payload = snapshot_to_import_nodes(nodes)
+    else:
+        with open(path, encoding='utf-8-sig') as f:
+            text = f.read()
+
+    if fmt == 'json':
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            click.echo(f'Error: invalid JSON: {e}')
+            raise SystemExit(1)
+        # 允許檔案本身就是節點陣列，或 {"rule": {...}, "rule_id": ..., "nodes": [...]}
+        if isinstance(data, dict):
+            try:
+                rule_data = {**validate_rule_data(data.get('rule')), **rule_data}
+            except RuleImportError as e:
+                click.echo(f'Error: invalid rule: {"; ".join(e.errors)}')
+                raise SystemExit(1)
+            rule_id = rule_id or data.get('rule_id')
+            payload = data.get('nodes')
+        else:
+            payload = data
+    elif fmt == 'csv':
+        payload = text
+
+    if rule_id is not None:
+        if not CodingRule.query.get(rule_id):
+            click.echo(f'Error: Rule with id {rule_id} not found')
+            raise SystemExit(1)
+    elif not rule_data.get('name'):
+        click.echo('Error: either --rule-id or --name is required')
+        raise SystemExit(1)
+
+    try:
+        if fmt == 'snapshot':
+            levels = validate_import(payload, max_nodes)
+        else:
+            levels = prepare_import(payload, fmt, max_nodes)
+    except RuleImportError as e:
+        click.echo(f'Error: import validation failed ({len(e.errors)} errors)')
+        for message in e.errors[:MAX_REPORTED_ERRORS]:
+            click.echo(f'  - {message}')
+        raise SystemExit(1)
+
+    rule_id, count, elapsed = import_rule(levels, rule_id=rule_id, rule_data=rule_data)
+    invalidate_rule(rule_id)
+    rate = f'{count / elapsed:,.0f} nodes/s' if elapsed > 0 else 'n/a'
+    click.echo(f'✅ Imported {count} nodes into rule {rule_id} in {elapsed * 1000:.1f} ms ({rate})')
+
+
+
+@click.command('export-rule')
+@click.argument('rule_id', type=int)
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--no-compress', is_flag=True, help='不壓縮快照本文')
+@with_appcontext
+def export_rule_command(rule_id, path, no_compress):
+    """將規則匯出為快照 (.crsnap)，可用 import-rule 匯入或由離線解碼站直接載入"""
+    from src.models.coding_rule import CodingNode, CodingRule
+    from src.utils.rule_snapshot import write_snapshot
+
+    rule = CodingRule.query.get(rule_id)
+    if not rule:
+        click.echo(f'Error: Rule with id {rule_id} not found')
+        raise SystemExit(1)
+
+    nodes = CodingNode.query.filter_by(rule_id=rule_id).all()
+    size = 0
+    with open(path, 'wb') as f:
+        for chunk in write_snapshot(rule, nodes, compress=not no_compress):
+            f.write(chunk)
+            size += len(chunk)
+    click.echo(f'✅ Exported rule {rule_id} ({len(nodes)} nodes, revision {rule.revision}) to {path} ({size:,} bytes)')
+
+
+@click.command('prune-blocklist')
+@click.option('--batch-size', type=int, help='每批刪除筆數 (預設 JWT_BLOCKLIST_PRUNE_BATCH_SIZE)')
+@click.option('--max-batches', type=int, help='最多執行的批數 (預設刪到沒有過期紀錄為止)')
+@with_appcontext
+def prune_blocklist_command(batch_size, max_batches):
+    """分批刪除已過期的 JWT 黑名單紀錄 (可由 cron 定期執行)"""
+    from flask import current_app
+    from src.services.token_blocklist import prune_expired, blocklist_stats
+
+    batch_size = batch_size or current_app.config['JWT_BLOCKLIST_PRUNE_BATCH_SIZE']
+    deleted = prune_expired(batch_size=batch_size, max_batches=max_batches)
+    stats = blocklist_stats()
+    click.echo(f'✅ Pruned {deleted} expired tokens ({stats["table_rows"]} rows remaining, {stats["expired_rows"]} still expired)')
@@ -13,4 +13,58 @@ class Config:
     JWT_CSRF_CHECK_FORM = True
     JWT_COOKIE_SECURE = True
     JWT_TOKEN_LOCATION = ['cookies']
-    JWT_COOKIE_SAMESITE = 'None'
\ No newline at end of file
+    JWT_COOKIE_SAMESITE = 'None'
+
+    # JWT 黑名單 process 內快取；其他 worker 的登出最多延遲 JWT_BLOCKLIST_REFRESH_SECONDS 秒生效
+    JWT_BLOCKLIST_CACHE_ENABLED = os.getenv('JWT_BLOCKLIST_CACHE_ENABLED', 'true').lower() == 'true'
+    JWT_BLOCKLIST_REFRESH_SECONDS = int(os.getenv('JWT_BLOCKLIST_REFRESH_SECONDS', 5))
+
+    # 過期黑名單紀錄的背景清理間隔 (秒，0 表示不啟動，改以 flask prune-blocklist 排程)，以及每批 / 每次清理的上限
+    JWT_BLOCKLIST_SWEEP_SECONDS = int(os.getenv('JWT_BLOCKLIST_SWEEP_SECONDS', 0))
+    JWT_BLOCKLIST_PRUNE_BATCH_SIZE = int(os.getenv('JWT_BLOCKLIST_PRUNE_BATCH_SIZE', 1000))
+    JWT_BLOCKLIST_PRUNE_MAX_BATCHES = int(os.getenv('JWT_BLOCKLIST_PRUNE_MAX_BATCHES', 10))
+
+    # 管理員再驗證 (POST /auth/sudo) 的有效分鐘數，期間內敏感操作不需再輸入密碼
+    ADMIN_REAUTH_MINUTES = int(os.getenv('ADMIN_REAUTH_MINUTES', 5))
+
+    # 登入限流 (token bucket)：每個帳號 / 每個來源 IP 在 LOGIN_RATE_LIMIT_WINDOW_SECONDS 內可嘗試的次數
+    # LOGIN_RATE_LIMIT_STORAGE 為 memory (每個 worker 各自計數) 或 sqlite:///path (同一主機的 worker 共用)
+    LOGIN_RATE_LIMIT_ENABLED = os.getenv('LOGIN_RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    LOGIN_RATE_LIMIT_USERNAME_ATTEMPTS = int(os.getenv('LOGIN_RATE_LIMIT_USERNAME_ATTEMPTS', 5))
+    LOGIN_RATE_LIMIT_IP_ATTEMPTS = int(os.getenv('LOGIN_RATE_LIMIT_IP_ATTEMPTS', 20))
+    LOGIN_RATE_LIMIT_WINDOW_SECONDS = int(os.getenv('LOGIN_RATE_LIMIT_WINDOW_SECONDS', 60))
+    LOGIN_RATE_LIMIT_STORAGE = os.getenv('LOGIN_RATE_LIMIT_STORAGE', 'memory')
+
+    # 密碼雜湊演算法與成本 (werkzeug 格式，例如 scrypt:32768:8:1 或 pbkdf2:sha256:600000)；
+    # 變更後既有使用者於下次登入成功時自動以新參數重新雜湊
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+    # 雜湊在獨立的 process pool 中計算 (0 表示在請求執行緒中計算)；超過排隊上限或逾時回傳 503
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_QUEUE = int(os.getenv('PASSWORD_HASH_MAX_QUEUE', 16))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 5))
+
+    # 批次解碼 (/coding-rules/decode/batch) 單次請求最多可帶的代碼數量
+    DECODE_BATCH_MAX_SIZE = int(os.getenv('DECODE_BATCH_MAX_SIZE', 10000))
+
+    # 串流解碼 (/coding-rules/decode/stream) 單行最大長度 (bytes)
+    DECODE_STREAM_MAX_LINE_LENGTH = int(os.getenv('DECODE_STREAM_MAX_LINE_LENGTH', 1024))
+
+    # 「列出所有解讀」模式下，每個代碼最多回傳的解讀數量
+    DECODE_MAX_INTERPRETATIONS = int(os.getenv('DECODE_MAX_INTERPRETATIONS', 50))
+
+    # 解碼結果快取 (LRU + TTL)，記憶體上限以 bytes 計算
+    DECODE_CACHE_ENABLED = os.getenv('DECODE_CACHE_ENABLED', 'true').lower() == 'true'
+    DECODE_CACHE_MAX_BYTES = int(os.getenv('DECODE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    DECODE_CACHE_TTL = int(os.getenv('DECODE_CACHE_TTL', 3600))
+
+    # 已編譯規則快取每隔幾秒比對一次 coding_rules.revision，以發現其他 worker 的修改 (0 表示不比對)
+    RULE_CACHE_REVALIDATE_SECONDS = int(os.getenv('RULE_CACHE_REVALIDATE_SECONDS', 5))
+
+    # 為 true 時只解碼已發佈的規則；預設尚未發佈過的規則仍以草稿解碼
+    DECODE_REQUIRE_PUBLISHED = os.getenv('DECODE_REQUIRE_PUBLISHED', 'false').lower() == 'true'
+
+    # 規則樹批次匯入 (/coding-rules/import 與 flask import-rule) 單次最多節點數
+    RULE_IMPORT_MAX_NODES = int(os.getenv('RULE_IMPORT_MAX_NODES', 100000))
+
+    # 刪除子樹時每個 DELETE 陳述式最多刪除的節點數
+    NODE_DELETE_BATCH_SIZE = int(os.getenv('NODE_DELETE_BATCH_SIZE', 1000))
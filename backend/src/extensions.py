@@ -1,9 +1,29 @@
+import sqlite3
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from src.utils.decode_cache import DecodeCache
+from src.utils.blocklist_cache import BlocklistCache
+from src.utils.rate_limit import LoginRateLimiter
+from src.utils.password_hasher import PasswordHasher
 
 db = SQLAlchemy()
 migrate = Migrate()
 cors = CORS()
 jwt = JWTManager()
+decode_cache = DecodeCache()
+blocklist_cache = BlocklistCache()
+login_limiter = LoginRateLimiter()
+password_hasher = PasswordHasher()
+
+
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite 預設不檢查外鍵；coding_node_closure 依賴 ON DELETE CASCADE，開發與 PostgreSQL 行為需一致
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
@@ -1,3 +1,5 @@
+from datetime import datetime, timezone
+from sqlalchemy import event
 from src.extensions import db
 
 class CodingRule(db.Model):
@@ -8,15 +10,34 @@ class CodingRule(db.Model):
     total_length = db.Column(db.Integer, default=16)
     is_active = db.Column(db.Boolean, default=True)
 
+    # 規則或其節點每次變動都會遞增，用於 ETag 與各 worker 的規則快取失效
+    revision = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    # 最新的發佈版本號 (coding_rule_versions.version)，None 代表尚未發佈，解碼時使用草稿 (coding_nodes)
+    published_version = db.Column(db.Integer, nullable=True)
+
+    @staticmethod
+    def bump_revision(rule_id):
+        """在目前的交易中遞增規則版本 (由呼叫端 commit)"""
+        db.session.execute(
+            db.update(CodingRule)
+            .where(CodingRule.id == rule_id)
+            .values(revision=CodingRule.revision + 1)
+        )
+
     def __repr__(self):
         return f'<CodingRule {self.name}>'
 
 class CodingNode(db.Model):
     __tablename__ = 'coding_nodes'
+    # 某一層節點依 (sort_order, id) 排序與 keyset 分頁，由此索引直接提供順序，不必每頁排序整層
+    __table_args__ = (
+        db.Index('ix_coding_nodes_rule_id_parent_id_sort_order', 'rule_id', 'parent_id', 'sort_order', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     rule_id = db.Column(db.Integer, db.ForeignKey('coding_rules.id'), nullable=False)
-    parent_id = db.Column(db.Integer, db.ForeignKey('coding_nodes.id'), nullable=True)
+    parent_id = db.Column(db.Integer, db.ForeignKey('coding_nodes.id'), nullable=True, index=True)
     
     name = db.Column(db.String(100), nullable=False)
     segment_length = db.Column(db.Integer, nullable=False)
@@ -28,7 +49,7 @@ class CodingNode(db.Model):
     value_regex = db.Column(db.String(100), nullable=True)
     value_placeholder = db.Column(db.String(50), nullable=True)
     
-    sort_order = db.Column(db.Integer, default=0)
+    sort_order = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     description = db.Column(db.Text, nullable=True)
 
     # Relationships
@@ -38,5 +59,92 @@ class CodingNode(db.Model):
                              lazy=True,
                              cascade="all, delete-orphan")
 
+    @staticmethod
+    def delete_subtree(node_id, batch_size=1000):
+        """
+        刪除節點與其所有子孫 (由呼叫端 commit)，回傳刪除的節點數。
+        子樹 id 由 closure table 一次查出，依深度由深到淺分批刪除，每批刪除後 parent_id 外鍵仍成立。
+        """
+        ids = db.session.execute(
+            db.select(CodingNodeClosure.descendant_id)
+            .where(CodingNodeClosure.ancestor_id == node_id)
+            .order_by(CodingNodeClosure.depth.desc())
+        ).scalars().all()
+
+        deleted = 0
+        for start in range(0, len(ids), batch_size):
+            result = db.session.execute(
+                db.delete(CodingNode).where(CodingNode.id.in_(ids[start:start + batch_size])),
+                execution_options={"synchronize_session": False}
+            )
+            deleted += result.rowcount
+        return deleted
+
     def __repr__(self):
-        return f'<CodingNode {self.name}>'
\ No newline at end of file
+        return f'<CodingNode {self.name}>'
+
+class CodingNodeClosure(db.Model):
+    """
+    coding_nodes 的 closure table: 每個節點與其所有祖先 (含自己，depth = 0) 各一列。
+    子樹查詢與刪除只需以 ancestor_id 做一次索引查詢，不必遞迴載入。
+    """
+    __tablename__ = 'coding_node_closure'
+
+    ancestor_id = db.Column(db.Integer, db.ForeignKey('coding_nodes.id', ondelete='CASCADE'), primary_key=True)
+    descendant_id = db.Column(db.Integer, db.ForeignKey('coding_nodes.id', ondelete='CASCADE'), primary_key=True, index=True)
+    depth = db.Column(db.Integer, nullable=False)
+
+    @staticmethod
+    def add_nodes(node_ids):
+        """
+        為剛寫入的節點建立 closure 列 (由呼叫端 commit)。
+        父節點的 closure 列必須已存在，因此批次寫入時需依層級由上而下呼叫。
+        """
+        if not node_ids:
+            return
+        db.session.execute(
+            db.insert(CodingNodeClosure).from_select(
+                ['ancestor_id', 'descendant_id', 'depth'],
+                db.union_all(
+                    db.select(CodingNode.id, CodingNode.id, db.literal(0))
+                    .where(CodingNode.id.in_(node_ids)),
+                    db.select(CodingNodeClosure.ancestor_id, CodingNode.id, CodingNodeClosure.depth + 1)
+                    .join(CodingNodeClosure, CodingNodeClosure.descendant_id == CodingNode.parent_id)
+                    .where(CodingNode.id.in_(node_ids))
+                )
+            )
+        )
+
+    @staticmethod
+    def subtree_ids(node_id):
+        """節點本身與所有子孫的 id (子查詢)"""
+        return db.select(CodingNodeClosure.descendant_id).where(CodingNodeClosure.ancestor_id == node_id)
+
+    def __repr__(self):
+        return f'<CodingNodeClosure {self.ancestor_id}->{self.descendant_id}>'
+
+
+class CodingRuleVersion(db.Model):
+    """
+    規則的發佈版本: 發佈當下整棵節點樹的快照 (src/utils/rule_snapshot.py 格式，保留原始節點 id)。
+    建立後不可修改，因此由它編譯出的解碼器與解碼快取都不需要失效。
+    """
+    __tablename__ = 'coding_rule_versions'
+    __table_args__ = (db.UniqueConstraint('rule_id', 'version', name='uq_coding_rule_versions_rule_id_version'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    rule_id = db.Column(db.Integer, db.ForeignKey('coding_rules.id'), nullable=False, index=True)
+    version = db.Column(db.Integer, nullable=False)
+    snapshot = db.Column(db.LargeBinary, nullable=False)
+    node_count = db.Column(db.Integer, nullable=False)
+    draft_revision = db.Column(db.Integer, nullable=False)  # 發佈時草稿的 revision
+    published_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    published_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+
+    def __repr__(self):
+        return f'<CodingRuleVersion {self.rule_id} v{self.version}>'
+
+
+@event.listens_for(CodingRuleVersion, 'before_update')
+def _reject_version_update(mapper, connection, target):
+    raise ValueError("Published rule versions are immutable")
@@ -6,7 +6,10 @@ class TokenBlocklist(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     jti = db.Column(db.String(36), nullable=False, index=True) # Token 的唯一身分證號
-    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    # BlocklistCache 以 created_at 增量同步，需要索引
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc), index=True)
+    # Token 本身的過期時間 (exp)，過期後這筆紀錄即可刪除；舊資料為 NULL，以 created_at + Token 有效期限判斷
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
 
     def __repr__(self):
-        return f'<TokenBlocklist {self.jti}>'
\ No newline at end of file
+        return f'<TokenBlocklist {self.jti}>'
@@ -1,5 +1,4 @@
-from src.extensions import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from src.extensions import db, password_hasher
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -21,10 +20,15 @@ class User(db.Model):
     is_password_changed = db.Column(db.Boolean, default=False)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        # 雜湊在 password_hasher 的 process pool 中計算，忙碌時拋出 PasswordHashUnavailable
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        """已存的雜湊與目前 PASSWORD_HASH_METHOD 的演算法或成本不同"""
+        return password_hasher.needs_rehash(self.password_hash)
 
     def __repr__(self):
         return f'<User {self.username}>'
\ No newline at end of file
@@ -1,10 +1,14 @@
+import math
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt, set_access_cookies, unset_jwt_cookies, get_jwt_identity
-from src.services.auth import login_service, logout_service
+from src.services.auth import login_service, logout_service, sudo_service
+from src.services.token_blocklist import blocklist_stats
 from src.models.user import User
-from src.extensions import db
+from src.extensions import db, blocklist_cache, login_limiter, password_hasher
 from werkzeug.security import generate_password_hash
 from src.utils.validators import validate_password_strength
+from src.utils.decorators import admin_required
+from src.utils.password_hasher import PasswordHashUnavailable
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -15,6 +19,15 @@ def login():
         if not data:
             return jsonify({"message": "No input data provided"}), 400
 
+        # 在計算密碼雜湊之前限流，被拒絕的嘗試不佔用 worker CPU
+        username = data.get('username')
+        if isinstance(username, str) and username:
+            retry_after = login_limiter.check(username, request.remote_addr)
+            if retry_after is not None:
+                response = jsonify({"message": "Too many login attempts, please try again later"})
+                response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+                return response, 429
+
         result = login_service(data)
 
         if result:
@@ -29,6 +42,8 @@ def login():
         else:
             return jsonify({"message": "Invalid username or password"}), 401
 
+    except PasswordHashUnavailable:
+        raise   # 由 app 層的 errorhandler 統一回傳 503
     except Exception as e:
         current_app.logger.error(f"Login error: {str(e)}")
         return jsonify({"message": "Internal Server Error"}), 500
@@ -37,10 +52,10 @@ def login():
 @jwt_required() # 必須帶 Token 才能呼叫
 def logout():
     try:
-        jti = get_jwt()["jti"]
+        claims = get_jwt()
         
         # 呼叫 Service 將已使用的 Token 加入黑名單
-        logout_service(jti)
+        logout_service(claims["jti"], claims.get("exp"))
         
         response = jsonify({"message": "Successfully logged out"})
         unset_jwt_cookies(response)
@@ -52,6 +67,73 @@ def logout():
         current_app.logger.error(f"Logout error: {str(e)}")
         return response, 500
 
+@auth_bp.route('/sudo', methods=['POST'])
+@admin_required()
+def sudo():
+    """
+    管理員再驗證：核對一次密碼後換發短期 fresh Token (ADMIN_REAUTH_MINUTES 分鐘)，
+    期間內新增 / 刪除 / 重設密碼等敏感操作不需再輸入密碼
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        user = User.query.get(get_jwt_identity())
+        if not user:
+            return jsonify({"message": "User not found"}), 404
+
+        # 與登入共用限流，避免被當成猜密碼的管道
+        retry_after = login_limiter.check(user.username, request.remote_addr)
+        if retry_after is not None:
+            response = jsonify({"message": "Too many attempts, please try again later"})
+            response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+            return response, 429
+
+        result = sudo_service(user, data.get('current_password'), current_app.config['ADMIN_REAUTH_MINUTES'])
+        if not result:
+            return jsonify({"message": "Invalid admin password"}), 401
+
+        access_token, expires_at = result
+        response = jsonify({
+            "message": "Re-authenticated",
+            "data": {"sudo_expires_at": expires_at.isoformat()}
+        })
+        set_access_cookies(response, access_token)
+        return response, 200
+    except PasswordHashUnavailable:
+        raise   # 由 app 層的 errorhandler 統一回傳 503
+    except Exception as e:
+        current_app.logger.error(f"Sudo error: {str(e)}")
+        return jsonify({"message": "Internal Server Error"}), 500
+
+@auth_bp.route('/blocklist/stats', methods=['GET'])
+@admin_required()
+def blocklist_metrics():
+    """黑名單資料表大小、已清理筆數 (僅統計目前這個 worker) 與 process 內快取狀態"""
+    try:
+        return jsonify({"data": {**blocklist_stats(), "cache": blocklist_cache.stats()}}), 200
+    except Exception as e:
+        current_app.logger.error(f"Blocklist stats error: {str(e)}")
+        return jsonify({"message": "Internal Server Error"}), 500
+
+@auth_bp.route('/login/stats', methods=['GET'])
+@admin_required()
+def login_limiter_metrics():
+    """登入限流設定與允許 / 拒絕次數 (僅統計目前這個 worker)"""
+    try:
+        return jsonify({"data": login_limiter.stats()}), 200
+    except Exception as e:
+        current_app.logger.error(f"Login limiter stats error: {str(e)}")
+        return jsonify({"message": "Internal Server Error"}), 500
+
+@auth_bp.route('/password-hash/stats', methods=['GET'])
+@admin_required()
+def password_hash_metrics():
+    """密碼雜湊工作池設定與完成 / 拒絕 / 逾時次數 (僅統計目前這個 worker)"""
+    try:
+        return jsonify({"data": password_hasher.stats()}), 200
+    except Exception as e:
+        current_app.logger.error(f"Password hash stats error: {str(e)}")
+        return jsonify({"message": "Internal Server Error"}), 500
+
 @auth_bp.route('/me', methods=['GET'])
 @jwt_required()
 def me():
@@ -107,6 +189,8 @@ def change_password():
         db.session.commit()
 
         return jsonify({"message": "Password changed successfully"}), 200
+    except PasswordHashUnavailable:
+        raise   # 由 app 層的 errorhandler 統一回傳 503
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Change password error: {str(e)}")
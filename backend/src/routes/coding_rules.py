@@ -1,28 +1,66 @@
-from flask import Blueprint, request, jsonify, current_app
-from src.models.coding_rule import CodingNode, CodingRule
-from src.extensions import db
-from src.utils.decorators import admin_required
+import csv
+import json
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from src.models.coding_rule import CodingNode, CodingRule, CodingNodeClosure, CodingRuleVersion
+from src.extensions import db, decode_cache
+from src.utils.decorators import admin_required, has_recent_reauth
+from src.utils.validators import validate_regex
 from src.models.user import User
 from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import func, case, tuple_
 from sqlalchemy.exc import IntegrityError
-from src.utils.rule_logic import attempt_decode_chain
+from src.utils.rule_logic import decode_code, decode_all, complete_prefix, parse_electronic_values
+from src.utils.rule_cache import get_root_index, get_rule_version, invalidate_rule
+from src.utils.decode_metrics import start_decode_stats, get_decode_stats, finish_decode_stats, histogram_snapshot
+from src.services.node_move import apply_moves, NodeMoveError
+from src.services.rule_publish import publish_rule, PublishConflict
+from src.utils.password_hasher import PasswordHashUnavailable
+from src.services.rule_import import prepare_import, validate_import, validate_rule_data, import_rule, RuleImportError, MAX_REPORTED_ERRORS
+from src.utils.rule_snapshot import write_snapshot, read_snapshot, snapshot_to_import_nodes, SnapshotError
 
 coding_rules_bp = Blueprint('coding_rules', __name__)
 
+def _not_modified(etag):
+    """若用戶端的 If-None-Match 與目前的 ETag 相同，回傳 304 回應，否則回傳 None"""
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return None
+
+def _with_etag(response, etag):
+    response.set_etag(etag, weak=True)
+    # 允許快取，但每次使用前都要以 If-None-Match 重新驗證
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @coding_rules_bp.route('', methods=['GET'])
 def get_rules():
     try:
+        # 規則不會被刪除且 revision、published_version 只增不減，用聚合值即可代表整份列表的版本
+        count, max_id, revision_sum, published_sum = db.session.query(
+            func.count(CodingRule.id), func.max(CodingRule.id), func.sum(CodingRule.revision),
+            func.sum(CodingRule.published_version)
+        ).one()
+        etag = f"rules-{count}-{max_id or 0}-{revision_sum or 0}-{published_sum or 0}"
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+
         rules = CodingRule.query.all()
-        return jsonify({
+        return _with_etag(jsonify({
             "data": [
                 {
                     "id": r.id,
                     "name": r.name,
                     "total_length": r.total_length,
-                    "is_active": r.is_active
+                    "is_active": r.is_active,
+                    "revision": r.revision,
+                    "published_version": r.published_version
                 } for r in rules
             ]
-        }), 200
+        }), etag), 200
     except Exception as e:
         return jsonify({"message": f"Error fetching rules: {str(e)}"}), 500
 
@@ -40,44 +78,404 @@ def create_rule():
         )
         db.session.add(new_rule)
         db.session.commit()
+        invalidate_rule(new_rule.id)
         return jsonify({"message": "Rule created", "id": new_rule.id}), 201
     except Exception as e:
         return jsonify({"message": f"Error creating rule: {str(e)}"}), 500
 
+@coding_rules_bp.route('/import', methods=['POST'])
+@admin_required()
+def import_rule_tree():
+    """
+    批次匯入整棵規則樹，全部節點在同一交易中寫入 (全部成功或全部不寫入)。
+    - JSON: {"rule": {"name", "total_length", "is_active"}} 或 {"rule_id": 既有規則}，加上 "nodes"
+      (巢狀 children 或以用戶端 id / parent_id 描述的平面列表)
+    - CSV (Content-Type: text/csv): 規則以 ?rule_id= 或 ?name=&total_length= 指定
+    """
+    try:
+        if request.mimetype == 'text/csv':
+            fmt = 'csv'
+            payload = request.get_data(as_text=True)
+            rule_id = request.args.get('rule_id', type=int)
+            rule_data = {
+                "name": request.args.get('name'),
+                "total_length": request.args.get('total_length', 16, type=int)
+            }
+        else:
+            data = request.get_json(silent=True)
+            if not data:
+                return jsonify({"message": "No input data provided"}), 400
+            fmt = 'json'
+            payload = data.get('nodes')
+            rule_id = data.get('rule_id')
+            rule_data = data.get('rule')
+
+        if rule_id is not None and (not isinstance(rule_id, int) or isinstance(rule_id, bool)):
+            return jsonify({"message": "rule_id must be an integer"}), 400
+        try:
+            rule_data = validate_rule_data(rule_data)
+        except RuleImportError as e:
+            return jsonify({
+                "message": "Import validation failed",
+                "error_count": len(e.errors),
+                "errors": e.errors[:MAX_REPORTED_ERRORS]
+            }), 400
+
+        if rule_id is not None:
+            if not CodingRule.query.get(rule_id):
+                return jsonify({"message": f"Rule with id {rule_id} not found"}), 404
+        elif not rule_data.get('name'):
+            return jsonify({"message": "Either rule_id or a rule name is required"}), 400
+
+        try:
+            levels = prepare_import(payload, fmt, current_app.config['RULE_IMPORT_MAX_NODES'])
+        except RuleImportError as e:
+            return jsonify({
+                "message": "Import validation failed",
+                "error_count": len(e.errors),
+                "errors": e.errors[:MAX_REPORTED_ERRORS]
+            }), 400
+
+        rule_id, count, elapsed = import_rule(levels, rule_id=rule_id, rule_data=rule_data)
+        invalidate_rule(rule_id)
+        return jsonify({
+            "message": "Rule imported",
+            "data": {
+                "rule_id": rule_id,
+                "nodes": count,
+                "elapsed_ms": round(elapsed * 1000, 3),
+                "nodes_per_second": round(count / elapsed) if elapsed > 0 else None
+            }
+        }), 201
+    except Exception as e:
+        current_app.logger.error(f"Error importing rule tree: {str(e)}")
+        return jsonify({"message": "Internal Server Error"}), 500
+
+@coding_rules_bp.route('/<int:rule_id>/publish', methods=['POST'])
+@admin_required()
+def publish(rule_id):
+    """將目前的草稿凍結為新的發佈版本，之後解碼一律使用此版本，直到下次發佈"""
+    try:
+        rule = CodingRule.query.get(rule_id)
+        if not rule:
+            return jsonify({"message": f"Rule with id {rule_id} not found"}), 404
+
+        try:
+            version, created = publish_rule(rule, int(get_jwt_identity()))
+        except (PublishConflict, IntegrityError):
+            return jsonify({"message": "Rule is being published by another request, please retry"}), 409
+
+        if created:
+            invalidate_rule(rule_id)
+        return jsonify({
+            "message": "Rule published" if created else "Draft unchanged since last publish",
+            "data": _serialize_version(version)
+        }), 201 if created else 200
+    except Exception as e:
+        current_app.logger.error(f"Error publishing rule: {str(e)}")
+        return jsonify({"message": "Internal Server Error"}), 500
+
+@coding_rules_bp.route('/<int:rule_id>/versions', methods=['GET'])
+def get_versions(rule_id):
+    try:
+        rule = CodingRule.query.get(rule_id)
+        if not rule:
+            return jsonify({"message": f"Rule with id {rule_id} not found"}), 404
+
+        # 不載入快照內容
+        versions = CodingRuleVersion.query.options(db.defer(CodingRuleVersion.snapshot)).filter_by(
+            rule_id=rule_id
+        ).order_by(CodingRuleVersion.version.desc()).all()
+        return jsonify({
+            "published_version": rule.published_version,
+            "data": [_serialize_version(v) for v in versions]
+        }), 200
+    except Exception as e:
+        current_app.logger.error(f"Error fetching versions: {str(e)}")
+        return jsonify({"message": "Internal Server Error"}), 500
+
+@coding_rules_bp.route('/<int:rule_id>/versions/<int:version>/snapshot', methods=['GET'])
+def get_version_snapshot(rule_id, version):
+    """下載發佈版本的快照；內容永不改變，可被任意長時間快取"""
+    try:
+        etag = f"rule-{rule_id}-v{version}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        snapshot = db.session.query(CodingRuleVersion.snapshot).filter_by(rule_id=rule_id, version=version).scalar()
+        if snapshot is None:
+            return jsonify({"message": f"Version {version} of rule {rule_id} not found"}), 404
+
+        response = Response(snapshot, mimetype='application/octet-stream')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        response.headers['Content-Disposition'] = f'attachment; filename=rule-{rule_id}-v{version}.crsnap'
+        return response, 200
+    except Exception as e:
+        current_app.logger.error(f"Error fetching version snapshot: {str(e)}")
+        return jsonify({"message": "Internal Server Error"}), 500
+
+def _serialize_version(version):
+    return {
+        "rule_id": version.rule_id,
+        "version": version.version,
+        "node_count": version.node_count,
+        "draft_revision": version.draft_revision,
+        "published_at": version.published_at.isoformat() if version.published_at else None,
+        "published_by": version.published_by
+    }
+
 @coding_rules_bp.route('/<int:rule_id>/nodes', methods=['GET'])
 def get_nodes(rule_id):
+    """
+    取得某一層的節點。很寬的層級可用 keyset 分頁:
+    ?limit=100 取第一頁，之後帶 ?cursor=<上一頁回傳的 next_cursor> 繼續往下取。
+    """
     try:
         parent_id = request.args.get('parent_id', type=int)
-        
-        # 根據 rule_id 和 parent_id 取得節點列表
-        nodes = CodingNode.query.filter_by(
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+        if limit is not None and limit < 1:
+            return jsonify({"message": "limit must be a positive integer"}), 400
+
+        # 規則未變動時直接回 304，不載入任何節點
+        revision = db.session.query(CodingRule.revision).filter_by(id=rule_id).scalar()
+        etag = f"rule-{rule_id}-r{revision or 0}"
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+
+        # 根據 rule_id 和 parent_id 取得節點列表，依 (sort_order, id) 排序 (由複合索引提供順序)
+        query = CodingNode.query.filter_by(
             rule_id=rule_id, 
             parent_id=parent_id
-        ).order_by(CodingNode.sort_order).all()
-        
+        ).order_by(CodingNode.sort_order, CodingNode.id)
+
+        if cursor:
+            try:
+                after_sort, after_id = (int(x) for x in cursor.split(':', 1))
+            except ValueError:
+                return jsonify({"message": "Invalid cursor"}), 400
+            query = query.filter(tuple_(CodingNode.sort_order, CodingNode.id) > tuple_(after_sort, after_id))
+
+        # 多取一筆用來判斷是否還有下一頁
+        nodes = query.limit(limit + 1).all() if limit else query.all()
+        next_cursor = None
+        if limit and len(nodes) > limit:
+            nodes = nodes[:limit]
+            next_cursor = f"{nodes[-1].sort_order}:{nodes[-1].id}"
+
+        # 一次聚合查詢取得整層的子節點數與 OPTION 數 (用於前端判斷是否繼續渲染下一層)
+        counts = {}
+        if nodes:
+            rows = db.session.query(
+                CodingNode.parent_id,
+                func.count(CodingNode.id),
+                func.count(case((CodingNode.node_type == 'OPTION', 1)))
+            ).filter(
+                CodingNode.parent_id.in_([node.id for node in nodes])
+            ).group_by(CodingNode.parent_id).all()
+            counts = {row[0]: (row[1], row[2]) for row in rows}
+
         result = []
         for node in nodes:
-            # 檢查此節點是否有子節點 (用於前端判斷是否繼續渲染下一層)
-            has_children = CodingNode.query.filter_by(parent_id=node.id).first() is not None
-            
-            result.append({
-                "id": node.id,
-                "rule_id": node.rule_id,
-                "parent_id": node.parent_id,
-                "name": node.name,
-                "node_type": node.node_type,
-                "segment_length": node.segment_length,
-                "code": node.code,
-                "value_regex": node.value_regex,
-                "value_placeholder": node.value_placeholder,
-                "has_children": has_children
-            })
+            child_count, option_count = counts.get(node.id, (0, 0))
+            item = _serialize_node(node, child_count > 0)
+            item["child_count"] = child_count
+            item["option_count"] = option_count
+            result.append(item)
             
-        return jsonify({"data": result}), 200
+        return _with_etag(jsonify({"data": result, "next_cursor": next_cursor}), etag), 200
     except Exception as e:
         current_app.logger.error(f"Error fetching nodes: {str(e)}")
         return jsonify({"message": "Internal Server Error"}), 500
 
+@coding_rules_bp.route('/<int:rule_id>/tree', methods=['GET'])
+def get_tree(rule_id):
+    """
+    一次取得整棵規則樹 (巢狀結構)，可用 ?depth= 限制層數。
+    只用一次查詢載入該規則所有節點，在記憶體中組成樹狀結構。
+    """
+    try:
+        depth = request.args.get('depth', type=int)
+        if depth is not None and depth < 1:
+            return jsonify({"message": "depth must be a positive integer"}), 400
+
+        rule = CodingRule.query.get(rule_id)
+        if not rule:
+            return jsonify({"message": f"Rule with id {rule_id} not found"}), 404
+
+        etag = f"rule-{rule_id}-r{rule.revision}"
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+
+        nodes = CodingNode.query.filter_by(rule_id=rule_id).order_by(CodingNode.sort_order, CodingNode.id).all()
+
+        by_parent = {}
+        for node in nodes:
+            by_parent.setdefault(node.parent_id, []).append(node)
+
+        def build(parent_id, level):
+            items = []
+            for node in by_parent.get(parent_id, []):
+                has_children = node.id in by_parent
+                item = _serialize_node(node, has_children)
+                # 超過 depth 的層級不展開，前端可依 has_children 再向下載入
+                item["children"] = build(node.id, level + 1) if has_children and (depth is None or level < depth) else []
+                items.append(item)
+            return items
+
+        return _with_etag(jsonify({
+            "data": {
+                "id": rule.id,
+                "name": rule.name,
+                "total_length": rule.total_length,
+                "is_active": rule.is_active,
+                "revision": rule.revision,
+                "nodes": build(None, 1)
+            }
+        }), etag), 200
+    except Exception as e:
+        current_app.logger.error(f"Error fetching tree: {str(e)}")
+        return jsonify({"message": "Internal Server Error"}), 500
+
+@coding_rules_bp.route('/<int:rule_id>/snapshot', methods=['GET'])
+def export_snapshot(rule_id):
+    """
+    以精簡的二進位快照格式 (見 src/utils/rule_snapshot.py) 串流匯出整條規則。
+    ?node_id= 只匯出該節點以下的分支 (該節點成為快照的根)，?compress=false 可取得未壓縮的版本。
+    """
+    try:
+        rule = CodingRule.query.get(rule_id)
+        if not rule:
+            return jsonify({"message": f"Rule with id {rule_id} not found"}), 404
+
+        node_id = request.args.get('node_id', type=int)
+        compress = request.args.get('compress', 'true').lower() != 'false'
+        scope = f"n{node_id}" if node_id is not None else "all"
+        etag = f"snapshot-{rule_id}-r{rule.revision}-{scope}-{'z' if compress else 'raw'}"
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+
+        query = CodingNode.query.filter_by(rule_id=rule_id)
+        if node_id is not None:
+            query = query.filter(CodingNode.id.in_(CodingNodeClosure.subtree_ids(node_id)))
+        nodes = query.all()
+        if node_id is not None and not nodes:
+            return jsonify({"message": "Node not found"}), 404
+
+        response = Response(
+            stream_with_context(write_snapshot(rule, nodes, compress=compress)),
+            mimetype='application/octet-stream'
+        )
+        filename = f"rule-{rule_id}-r{rule.revision}" + (f"-node-{node_id}" if node_id is not None else "")
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}.crsnap'
+        return _with_etag(response, etag), 200
+    except Exception as e:
+        current_app.logger.error(f"Error exporting snapshot: {str(e)}")
+        return jsonify({"message": "Internal Server Error"}), 500
+
+@coding_rules_bp.route('/snapshot', methods=['POST'])
+@admin_required()
+def import_snapshot():
+    """
+    匯入快照 (request body 為快照內容)，預設建立新規則；
+    ?rule_id= 匯入至既有規則，?name= 覆寫新規則名稱。整棵樹在單一交易中寫入。
+    """
+    try:
+        rule_id = request.args.get('rule_id', type=int)
+        if rule_id is not None and not CodingRule.query.get(rule_id):
+            return jsonify({"message": f"Rule with id {rule_id} not found"}), 404
+
+        max_nodes = current_app.config['RULE_IMPORT_MAX_NODES']
+        try:
+            rule, nodes = read_snapshot(request.stream, max_nodes=max_nodes)
+        except SnapshotError as e:
+            return jsonify({"message": f"Invalid snapshot: {str(e)}"}), 400
+
+        try:
+            levels = validate_import(snapshot_to_import_nodes(nodes), max_nodes)
+        except RuleImportError as e:
+            return jsonify({
+                "message": "Import validation failed",
+                "error_count": len(e.errors),
+                "errors": e.errors[:MAX_REPORTED_ERRORS]
+            }), 400
+
+        rule_data = {
+            "name": request.args.get('name') or rule.name,
+            "total_length": rule.total_length,
+            "is_active": rule.is_active
+        }
+        rule_id, count, elapsed = import_rule(levels, rule_id=rule_id, rule_data=rule_data)
+        invalidate_rule(rule_id)
+        return jsonify({
+            "message": "Snapshot imported",
+            "data": {
+                "rule_id": rule_id,
+                "nodes": count,
+                "elapsed_ms": round(elapsed * 1000, 3),
+                "nodes_per_second": round(count / elapsed) if elapsed > 0 else None
+            }
+        }), 201
+    except Exception as e:
+        current_app.logger.error(f"Error importing snapshot: {str(e)}")
+        return jsonify({"message": "Internal Server Error"}), 500
+
+def _serialize_node(node, has_children):
+    return {
+        "id": node.id,
+        "rule_id": node.rule_id,
+        "parent_id": node.parent_id,
+        "name": node.name,
+        "node_type": node.node_type,
+        "segment_length": node.segment_length,
+        "code": node.code,
+        "value_regex": node.value_regex,
+        "value_placeholder": node.value_placeholder,
+        "has_children": has_children
+    }
+
+@coding_rules_bp.route('/nodes/<int:node_id>/subtree', methods=['GET'])
+def get_subtree(node_id):
+    """
+    取得某節點 (含) 以下的整棵子樹。透過 closure table 以一次查詢取得所有子孫，?depth= 限制相對深度。
+    """
+    try:
+        depth = request.args.get('depth', type=int)
+        if depth is not None and depth < 0:
+            return jsonify({"message": "depth must not be negative"}), 400
+
+        query = db.session.query(CodingNode, CodingNodeClosure.depth).join(
+            CodingNodeClosure, CodingNodeClosure.descendant_id == CodingNode.id
+        ).filter(CodingNodeClosure.ancestor_id == node_id)
+        if depth is not None:
+            query = query.filter(CodingNodeClosure.depth <= depth)
+        rows = query.order_by(CodingNodeClosure.depth, CodingNode.sort_order, CodingNode.id).all()
+        if not rows:
+            return jsonify({"message": "Node not found"}), 404
+
+        by_parent = {}
+        for node, _ in rows[1:]:
+            by_parent.setdefault(node.parent_id, []).append(node)
+
+        def build(node):
+            item = _serialize_node(node, node.id in by_parent)
+            item["children"] = [build(child) for child in by_parent.get(node.id, [])]
+            return item
+
+        return jsonify({
+            "data": build(rows[0][0]),
+            "descendant_count": len(rows) - 1
+        }), 200
+    except Exception as e:
+        current_app.logger.error(f"Error fetching subtree: {str(e)}")
+        return jsonify({"message": "Internal Server Error"}), 500
+
 @coding_rules_bp.route('/nodes', methods=['POST'])
 @admin_required()
 def create_node():
@@ -89,6 +487,9 @@ def create_node():
         required_fields = ['rule_id', 'name', 'segment_length']
         if not all(field in data for field in required_fields):
             return jsonify({"message": f"Missing required fields: {', '.join(required_fields)}"}), 400
+
+        if data.get('value_regex') and not validate_regex(data['value_regex']):
+            return jsonify({"message": "Invalid value_regex: not a valid regular expression"}), 400
         
         new_node = CodingNode(
             rule_id=data['rule_id'],
@@ -99,7 +500,7 @@ def create_node():
             code=data.get('code'),
             value_regex=data.get('value_regex'),
             value_placeholder=data.get('value_placeholder'),
-            sort_order=data.get('sort_order', 0),
+            sort_order=data.get('sort_order') or 0,
             description=data.get('description')
         )
         
@@ -109,7 +510,11 @@ def create_node():
              return jsonify({"message": f"Rule with id {data['rule_id']} not found"}), 404
 
         db.session.add(new_node)
+        db.session.flush()
+        CodingNodeClosure.add_nodes([new_node.id])
+        CodingRule.bump_revision(new_node.rule_id)
         db.session.commit()
+        invalidate_rule(new_node.rule_id)
         
         return jsonify({"message": "Node created", "id": new_node.id}), 201
     except Exception as e:
@@ -117,28 +522,66 @@ def create_node():
         current_app.logger.error(f"Error creating node: {str(e)}")
         return jsonify({"message": "Internal Server Error"}), 500
 
+@coding_rules_bp.route('/<int:rule_id>/nodes/move', methods=['POST'])
+@admin_required()
+def move_nodes(rule_id):
+    """
+    批次移動 / 重新排序節點: {"moves": [{"node_id", "parent_id", "sort_order"}, ...]}
+    parent_id 省略表示不換父節點，sort_order 為在新兄弟節點中的目標位置 (省略表示排到最後)。
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({"message": "No input data provided"}), 400
+
+        if not CodingRule.query.get(rule_id):
+            return jsonify({"message": f"Rule with id {rule_id} not found"}), 404
+
+        try:
+            updated = apply_moves(rule_id, data.get('moves'))
+        except NodeMoveError as e:
+            db.session.rollback()
+            return jsonify({"message": e.message}), e.status
+
+        db.session.commit()
+        if updated:
+            invalidate_rule(rule_id)
+        return jsonify({"message": "Nodes moved", "updated": updated}), 200
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error moving nodes: {str(e)}")
+        return jsonify({"message": "Internal Server Error"}), 500
+
 @coding_rules_bp.route('/nodes/<int:node_id>', methods=['DELETE'])
 @admin_required()
 def delete_node(node_id):
     try:
-        data = request.get_json(silent=True)
-        if not data or 'current_password' not in data:
-            return jsonify({"message": "Password is required"}), 400
+        # 在 /auth/sudo 再驗證有效期內不需再輸入密碼
+        if not has_recent_reauth():
+            data = request.get_json(silent=True)
+            if not data or 'current_password' not in data:
+                return jsonify({"message": "Password is required"}), 400
 
-        current_password = data['current_password']
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+            current_password = data['current_password']
+            user_id = get_jwt_identity()
+            user = User.query.get(user_id)
 
-        if not user or not user.check_password(current_password):
-            return jsonify({"message": "Invalid admin password"}), 401
+            if not user or not user.check_password(current_password):
+                return jsonify({"message": "Invalid admin password"}), 401
 
         node = CodingNode.query.get(node_id)
         if not node:
             return jsonify({"message": "Node not found"}), 404
             
-        db.session.delete(node)
+        rule_id = node.rule_id
+        # 不經 ORM cascade 逐層載入，直接以 id 批次刪除整棵子樹；closure 列由外鍵 ON DELETE CASCADE 一併移除
+        deleted = CodingNode.delete_subtree(node_id, current_app.config['NODE_DELETE_BATCH_SIZE'])
+        CodingRule.bump_revision(rule_id)
         db.session.commit()
-        return jsonify({"message": "Node deleted"}), 200
+        invalidate_rule(rule_id)
+        return jsonify({"message": "Node deleted", "deleted": deleted}), 200
+    except PasswordHashUnavailable:
+        raise   # 由 app 層的 errorhandler 統一回傳 503
     except IntegrityError:
         db.session.rollback()
         current_app.logger.warning(f"Failed to delete node {node_id}: IntegrityError (likely has children)")
@@ -156,27 +599,270 @@ def decode_rule():
         if not code:
             return jsonify({"message": "Code is required"}), 400
 
-        # 1. 取得所有根節點 (嘗試從不同的規則入口開始匹配)
-        roots = CodingNode.query.filter_by(parent_id=None).all()
-        
-        decoded_result = None
-
-        for root in roots:
-            # 嘗試從這個根節點開始解碼
-            result = attempt_decode_chain(root, code)
-            # 如果成功解碼且沒有剩餘字串 (或符合您的寬鬆標準)，則視為成功
-            if result and result['remaining'] == '':
-                decoded_result = result
-                break
+        rule_id = data.get('rule_id')
+        if rule_id is not None and (not isinstance(rule_id, int) or isinstance(rule_id, bool)):
+            return jsonify({"message": "rule_id must be an integer"}), 400
+
+        stats = start_decode_stats()
+        debug = _debug_requested(data)
+
+        # 從記憶體中已編譯的規則樹，只嘗試第一個字元可能匹配的根節點 (暖機後不需查詢資料庫)
+        # 版本號需在取得索引之前讀取，避免把新索引的結果存到舊版本的 key 下
+        with stats.phase('index'):
+            version = get_rule_version(rule_id)
+            index = get_root_index(rule_id)
+
+        # all=true: 回傳所有可能的解讀，用於找出有歧義的代碼
+        if data.get('all'):
+            interpretations = _decode_cached(code, rule_id, version, index, True)
+            if not interpretations:
+                return _decode_response({"message": "Decoding failed: No matching rule found or code is incomplete"}, 404, stats, debug)
+            return _decode_response({
+                "message": "Decode successful",
+                "data": interpretations,
+                "ambiguous": len(interpretations) > 1
+            }, 200, stats, debug)
+
+        segments = _decode_cached(code, rule_id, version, index, False)
         
-        if decoded_result:
-            return jsonify({
+        if segments:
+            return _decode_response({
                 "message": "Decode successful",
-                "data": decoded_result['segments']
-            }), 200
+                "data": segments
+            }, 200, stats, debug)
         else:
-            return jsonify({"message": "Decoding failed: No matching rule found or code is incomplete"}), 404
+            return _decode_response({"message": "Decoding failed: No matching rule found or code is incomplete"}, 404, stats, debug)
 
     except Exception as e:
         current_app.logger.error(f"Decode error: {str(e)}")
-        return jsonify({"message": "Internal Server Error"}), 500
\ No newline at end of file
+        return jsonify({"message": "Internal Server Error"}), 500
+
+@coding_rules_bp.route('/decode/batch', methods=['POST'])
+def decode_rule_batch():
+    try:
+        data = request.get_json(silent=True)
+        codes = data.get('codes') if isinstance(data, dict) else None
+        if not isinstance(codes, list):
+            return jsonify({"message": "codes must be an array"}), 400
+
+        max_size = current_app.config['DECODE_BATCH_MAX_SIZE']
+        if len(codes) > max_size:
+            return jsonify({"message": f"Too many codes: at most {max_size} per request"}), 413
+
+        rule_id = data.get('rule_id')
+        if rule_id is not None and (not isinstance(rule_id, int) or isinstance(rule_id, bool)):
+            return jsonify({"message": "rule_id must be an integer"}), 400
+
+        stats = start_decode_stats()
+        debug = _debug_requested(data)
+
+        # 整批只取一次規則樹索引，每個代碼共用
+        with stats.phase('index'):
+            version = get_rule_version(rule_id)
+            index = get_root_index(rule_id)
+
+        # 單筆失敗只記錄原因，不影響整批
+        all_interpretations = bool(data.get('all'))
+        results = [_decode_item(raw, rule_id, version, index, all_interpretations) for raw in codes]
+
+        return _decode_response({
+            "message": "Batch decode finished",
+            "data": results
+        }, 200, stats, debug)
+
+    except Exception as e:
+        current_app.logger.error(f"Batch decode error: {str(e)}")
+        return jsonify({"message": "Internal Server Error"}), 500
+
+@coding_rules_bp.route('/complete', methods=['GET'])
+def complete_code():
+    """
+    自動完成: GET /complete?prefix=RS4&rule_id=1&limit=20
+    回傳可能的下一個片段，直接由記憶體中的規則樹與字首樹回答，不查詢資料庫。
+    """
+    try:
+        prefix = request.args.get('prefix', '').strip()
+        rule_id = request.args.get('rule_id', type=int)
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 200)
+
+        index = get_root_index(rule_id)
+        suggestions = complete_prefix(prefix, index.prefix_candidates(prefix), limit)
+
+        return jsonify({"data": suggestions}), 200
+    except Exception as e:
+        current_app.logger.error(f"Complete error: {str(e)}")
+        return jsonify({"message": "Internal Server Error"}), 500
+
+@coding_rules_bp.route('/values/parse', methods=['POST'])
+def parse_values():
+    """
+    批次將數值代碼 (4K7、R010、104P...) 轉為 SI 基本單位的浮點數。
+    無法解析的代碼回傳 null。
+    """
+    try:
+        data = request.get_json(silent=True)
+        codes = data.get('codes') if isinstance(data, dict) else None
+        if not isinstance(codes, list) or not all(isinstance(c, str) for c in codes):
+            return jsonify({"message": "codes must be an array of strings"}), 400
+
+        max_size = current_app.config['DECODE_BATCH_MAX_SIZE']
+        if len(codes) > max_size:
+            return jsonify({"message": f"Too many codes: at most {max_size} per request"}), 413
+
+        return jsonify({"data": parse_electronic_values([c.strip() for c in codes])}), 200
+    except Exception as e:
+        current_app.logger.error(f"Parse values error: {str(e)}")
+        return jsonify({"message": "Internal Server Error"}), 500
+
+@coding_rules_bp.route('/decode/cache', methods=['GET'])
+@admin_required()
+def decode_cache_stats():
+    """解碼結果快取的命中/未命中/淘汰統計 (僅統計目前這個 worker)"""
+    return jsonify({"data": decode_cache.stats()}), 200
+
+@coding_rules_bp.route('/decode/metrics', methods=['GET'])
+@admin_required()
+def decode_metrics():
+    """解碼請求的節點展開數、回溯次數、SQL 數量與耗時直方圖 (僅統計目前這個 worker)"""
+    return jsonify({"data": histogram_snapshot()}), 200
+
+def _debug_requested(data):
+    """以 X-Decode-Debug header 或 body 中的 debug: true 開啟除錯統計"""
+    header = request.headers.get('X-Decode-Debug', '').lower()
+    return header in ('1', 'true') or (isinstance(data, dict) and bool(data.get('debug')))
+
+def _decode_response(body, status, stats, debug):
+    """累計直方圖，並在要求除錯時把本次請求的統計放進 debug 欄位與 X-Decode-Stats header"""
+    finish_decode_stats(stats)
+    if not debug:
+        return jsonify(body), status
+    snapshot = stats.to_dict()
+    body["debug"] = snapshot
+    response = jsonify(body)
+    response.headers['X-Decode-Stats'] = json.dumps(snapshot, separators=(',', ':'))
+    return response, status
+
+def _decode_cached(code, rule_id, version, index, all_interpretations):
+    """
+    先查解碼結果快取，未命中才實際解碼。
+    回傳 segments (或 all 模式的解讀列表)，解碼失敗回傳 None (失敗結果也會快取)。
+    """
+    stats = get_decode_stats()
+    if stats is None:
+        stats = start_decode_stats()
+    stats.codes += 1
+
+    key = (code, rule_id, all_interpretations, version)
+    with stats.phase('cache'):
+        hit, value = decode_cache.get(key)
+    if hit:
+        stats.cache_hits += 1
+        return value
+    stats.cache_misses += 1
+
+    with stats.phase('search'):
+        if all_interpretations:
+            value = decode_all(code, index.candidates(code), current_app.config['DECODE_MAX_INTERPRETATIONS'], stats) or None
+        else:
+            decoded = decode_code(code, index.candidates(code), stats)
+            value = decoded['segments'] if decoded else None
+
+    decode_cache.set(key, value)
+    return value
+
+def _decode_item(raw, rule_id, version, index, all_interpretations=False):
+    """解碼單筆代碼並轉成批次/串流共用的結果格式，錯誤不向外拋出"""
+    code = raw.strip() if isinstance(raw, str) else ''
+    if not code:
+        return {"code": raw, "success": False, "reason": "Code is required"}
+    try:
+        decoded = _decode_cached(code, rule_id, version, index, all_interpretations)
+    except Exception as e:
+        current_app.logger.error(f"Decode error for {code}: {str(e)}")
+        return {"code": code, "success": False, "reason": "Internal error"}
+
+    if decoded and all_interpretations:
+        return {"code": code, "success": True, "interpretations": decoded, "ambiguous": len(decoded) > 1}
+    if decoded:
+        return {"code": code, "success": True, "data": decoded}
+    return {"code": code, "success": False, "reason": "No matching rule found or code is incomplete"}
+
+def _iter_lines(stream, max_length):
+    """
+    逐行讀取請求內容，不把整個 body 讀進記憶體。
+    超過 max_length 的行會被略過並回傳 None。
+    """
+    while True:
+        line = stream.readline(max_length + 1)
+        if not line:
+            return
+        if len(line) > max_length and not line.endswith(b'\n'):
+            # 丟棄該行剩餘的內容
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(max_length + 1)
+            yield None
+            continue
+        yield line.decode('utf-8', errors='replace').rstrip('\r\n')
+
+def _iter_stream_codes(stream, fmt, max_length):
+    """
+    從 CSV 或 NDJSON 串流中取出代碼，yield (行號, 代碼或 None, 錯誤原因)。
+    - CSV: 若第一列有 "code" 欄位則視為標題列，否則取第一欄
+    - NDJSON: 每行為 JSON 字串，或含 "code" 欄位的物件
+    """
+    code_index = 0
+    for line_no, line in enumerate(_iter_lines(stream, max_length), start=1):
+        if line is None:
+            yield line_no, None, "Line too long"
+            continue
+        if not line.strip():
+            continue
+
+        if fmt == 'csv':
+            row = next(csv.reader([line]), [])
+            if line_no == 1:
+                header = [cell.strip().lower() for cell in row]
+                if 'code' in header:
+                    code_index = header.index('code')
+                    continue
+            yield line_no, row[code_index] if len(row) > code_index else '', None
+        else:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                yield line_no, None, "Invalid JSON"
+                continue
+            if isinstance(item, dict):
+                item = item.get('code')
+            yield line_no, item, None
+
+@coding_rules_bp.route('/decode/stream', methods=['POST'])
+def decode_rule_stream():
+    """
+    串流解碼: 上傳 CSV 或 NDJSON，逐行回傳 NDJSON 結果。
+    格式由 ?format=csv|ndjson 或 Content-Type (text/csv) 決定，預設為 NDJSON。
+    可用 ?rule_id= 指定只嘗試某條規則，?all=true 回傳所有可能的解讀。
+    """
+    fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({"message": "format must be csv or ndjson"}), 400
+
+    rule_id = request.args.get('rule_id', type=int)
+    all_interpretations = request.args.get('all', 'false').lower() == 'true'
+    max_length = current_app.config['DECODE_STREAM_MAX_LINE_LENGTH']
+    stream = request.stream
+
+    def generate():
+        stats = start_decode_stats()
+        version = get_rule_version(rule_id)
+        index = get_root_index(rule_id)
+        for line_no, code, error in _iter_stream_codes(stream, fmt, max_length):
+            if error:
+                item = {"code": code, "success": False, "reason": error}
+            else:
+                item = _decode_item(code, rule_id, version, index, all_interpretations)
+            item["line"] = line_no
+            yield json.dumps(item, ensure_ascii=False) + '\n'
+        finish_decode_stats(stats)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
@@ -1,15 +1,18 @@
 from flask import Blueprint, request, jsonify
 from src.models.user import User
 from src.extensions import db
-from src.utils.decorators import admin_required
+from src.utils.decorators import admin_required, has_recent_reauth
 from werkzeug.security import generate_password_hash
 from flask_jwt_extended import get_jwt_identity
 from src.utils.validators import validate_password_strength
+from src.utils.password_hasher import PasswordHashUnavailable
 
 user_bp = Blueprint('user', __name__)
 
 def verify_admin_password(password):
-    """驗證當前登入的管理員密碼"""
+    """驗證當前登入的管理員密碼 (在 /auth/sudo 再驗證有效期內直接通過)"""
+    if has_recent_reauth():
+        return True
     admin_id = get_jwt_identity()
     admin_user = User.query.get(admin_id)
     if not admin_user or not password or not admin_user.check_password(password):
@@ -120,6 +123,8 @@ def create_user():
         db.session.commit()
 
         return jsonify({"message": "User created successfully"}), 201
+    except PasswordHashUnavailable:
+        raise   # 由 app 層的 errorhandler 統一回傳 503
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Create user error: {str(e)}")
@@ -155,6 +160,8 @@ def reset_password(user_id):
         db.session.commit()
 
         return jsonify({"message": "Password reset successfully"}), 200
+    except PasswordHashUnavailable:
+        raise   # 由 app 層的 errorhandler 統一回傳 503
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Reset password error: {str(e)}")
@@ -186,6 +193,8 @@ def delete_user(user_id):
         db.session.delete(user)
         db.session.commit()
         return jsonify({"message": "User deleted successfully"}), 200
+    except PasswordHashUnavailable:
+        raise   # 由 app 層的 errorhandler 統一回傳 503
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Delete user error: {str(e)}")
@@ -1,8 +1,10 @@
 import logging
-from src.extensions import db
+from datetime import datetime, timedelta, timezone
+from src.extensions import db, blocklist_cache
 from src.models.user import User
 from flask_jwt_extended import create_access_token
 from src.models.token_blocklist import TokenBlocklist
+from src.services.token_blocklist import token_expires_at
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +31,15 @@ def login_service(data):
     if not user or not user.check_password(password):
         return None
 
+    # 2.1 雜湊參數已變更 (PASSWORD_HASH_METHOD)，趁有明文密碼時以新參數重新雜湊；失敗不影響登入
+    if user.password_needs_rehash():
+        try:
+            user.set_password(password)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Password rehash failed for user {user.id}: {str(e)}")
+
     # 3. 簽發 Token (把 User ID 和 Role 藏在 Token 裡)
     access_token = create_access_token(identity=str(user.id), additional_claims={"role": user.role})
 
@@ -42,15 +53,34 @@ def login_service(data):
     }
     return access_token, user_info
 
-def logout_service(jti):
+def sudo_service(user, password, minutes):
+    """
+    管理員再驗證：核對密碼後簽發 minutes 分鐘內視為 fresh 的新 Token。
+    回傳 (access_token, 再驗證到期時間)，密碼錯誤回傳 None。
+    """
+    if not isinstance(password, str) or not password or len(password) > 128:
+        return None
+    if not user.check_password(password):
+        return None
+
+    access_token = create_access_token(
+        identity=str(user.id),
+        additional_claims={"role": user.role},
+        fresh=timedelta(minutes=minutes)
+    )
+    return access_token, datetime.now(timezone.utc) + timedelta(minutes=minutes)
+
+def logout_service(jti, expires_at=None):
     """
-    將 Token 的 JTI 加入黑名單
+    將 Token 的 JTI 加入黑名單 (expires_at 為 Token 的 exp，Token 過期後紀錄即可清除)
     """
     try:
         # 建立一筆掛失紀錄
-        blocked_token = TokenBlocklist(jti=jti)
+        blocked_token = TokenBlocklist(jti=jti, expires_at=token_expires_at(expires_at))
         db.session.add(blocked_token)
         db.session.commit()
+        # 本 worker 立即生效；其他 worker 在下次增量同步時取得
+        blocklist_cache.add(jti, expires_at)
         return True
     except Exception as e:
         logger.error(f"Error revoking token {jti}: {str(e)}")
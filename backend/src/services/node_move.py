@@ -0,0 +1,174 @@
+import logging
+from sqlalchemy import case
+from src.extensions import db
+from src.models.coding_rule import CodingNode, CodingRule, CodingNodeClosure
+
+logger = logging.getLogger(__name__)
+
+# 每個 UPDATE / DELETE 陳述式最多處理的節點數
+UPDATE_BATCH_SIZE = 500
+
+_MISSING = object()
+
+
+class NodeMoveError(Exception):
+    """移動 / 排序請求不合法 (status 為建議的 HTTP 狀態碼)"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _parse_moves(moves):
+    """驗證請求格式，回傳 {node_id: (new_parent_id 或 _MISSING, sort_order 或 None)}"""
+    if not isinstance(moves, list) or not moves:
+        raise NodeMoveError("moves must be a non-empty array")
+
+    parsed = {}
+    for i, move in enumerate(moves):
+        if not isinstance(move, dict) or not isinstance(move.get('node_id'), int):
+            raise NodeMoveError(f"moves[{i}]: node_id is required")
+        node_id = move['node_id']
+        if node_id in parsed:
+            raise NodeMoveError(f"moves[{i}]: node {node_id} appears more than once")
+
+        parent_id = move.get('parent_id', _MISSING)
+        if parent_id is not _MISSING and parent_id is not None and not isinstance(parent_id, int):
+            raise NodeMoveError(f"moves[{i}]: parent_id must be an integer or null")
+        sort_order = move.get('sort_order')
+        if sort_order is not None and (not isinstance(sort_order, int) or sort_order < 0):
+            raise NodeMoveError(f"moves[{i}]: sort_order must be a non-negative integer")
+        parsed[node_id] = (parent_id, sort_order)
+    return parsed
+
+
+def apply_moves(rule_id, moves):
+    """
+    批次移動 / 重新排序同一規則內的節點 (由呼叫端 commit)，回傳實際更新的節點數。
+    每筆 move 為 {"node_id", "parent_id" (可省略表示不換父節點), "sort_order" (目標位置，可省略表示排到最後)}。
+    受影響的每一層都會重新編號為連續的 0..n-1。
+    """
+    parsed = _parse_moves(moves)
+
+    # 一次載入整條規則的結構欄位 (只有數字與型別)，之後的檢查與重新編號都在記憶體中完成
+    rows = db.session.query(
+        CodingNode.id, CodingNode.parent_id, CodingNode.node_type, CodingNode.sort_order
+    ).filter_by(rule_id=rule_id).all()
+    parent_of = {r.id: r.parent_id for r in rows}
+    type_of = {r.id: r.node_type for r in rows}
+    order_of = {r.id: r.sort_order or 0 for r in rows}
+
+    new_parent = dict(parent_of)
+    moved = set()
+    for node_id, (parent_id, _) in parsed.items():
+        if node_id not in parent_of:
+            raise NodeMoveError(f"Node {node_id} not found in rule {rule_id}", 404)
+        if parent_id is _MISSING or parent_id == parent_of[node_id]:
+            continue
+        if parent_id is not None and parent_id not in parent_of:
+            raise NodeMoveError(f"Parent {parent_id} not found in rule {rule_id}", 404)
+        new_parent[node_id] = parent_id
+        moved.add(node_id)
+
+    for node_id in moved:
+        parent_id = new_parent[node_id]
+        if parent_id is not None and type_of[parent_id] == 'OPTION':
+            raise NodeMoveError(f"Node {node_id}: OPTION nodes cannot have children")
+        if type_of[node_id] == 'OPTION' and (parent_id is None or type_of[parent_id] != 'STATIC'):
+            raise NodeMoveError(f"Node {node_id}: OPTION nodes must belong to a STATIC node")
+
+    # 依移動後的父子關係往上走，遇到自己即為循環
+    for node_id in moved:
+        seen = {node_id}
+        current = new_parent[node_id]
+        while current is not None:
+            if current in seen:
+                raise NodeMoveError(f"Moving node {node_id} would create a cycle", 409)
+            seen.add(current)
+            current = new_parent.get(current)
+
+    # 重新編號受影響的各層: 未指定位置的兄弟節點維持原本相對順序，指定位置的節點依序插入
+    affected_parents = {new_parent[n] for n in parsed} | {parent_of[n] for n in moved}
+    children = {}
+    for node_id in sorted(parent_of, key=lambda n: (order_of[n], n)):
+        if new_parent[node_id] in affected_parents:
+            children.setdefault(new_parent[node_id], []).append(node_id)
+
+    new_order = {}
+    for parent_id in affected_parents:
+        siblings = children.get(parent_id, [])
+        placed = sorted(
+            (n for n in siblings if n in parsed and parsed[n][1] is not None),
+            key=lambda n: (parsed[n][1], n)
+        )
+        placed_set = set(placed)
+        # 移入此層但未指定位置的節點排在最後 (依請求順序)
+        appended = [n for n in parsed if n in moved and new_parent[n] == parent_id and n not in placed_set]
+        appended_set = set(appended)
+        ordered = [n for n in siblings if n not in placed_set and n not in appended_set] + appended
+        for node_id in placed:
+            ordered.insert(min(parsed[node_id][1], len(ordered)), node_id)
+        for index, node_id in enumerate(ordered):
+            new_order[node_id] = index
+
+    changed = [
+        n for n in new_order
+        if new_order[n] != order_of[n] or new_parent[n] != parent_of[n]
+    ]
+    for start in range(0, len(changed), UPDATE_BATCH_SIZE):
+        batch = changed[start:start + UPDATE_BATCH_SIZE]
+        db.session.execute(
+            db.update(CodingNode)
+            .where(CodingNode.id.in_(batch))
+            .values(
+                # else_ 讓 CASE 的型別跟隨欄位 (全部 THEN NULL 時 PostgreSQL 會推斷為 text)
+                parent_id=case({n: new_parent[n] for n in batch}, value=CodingNode.id, else_=CodingNode.parent_id),
+                sort_order=case({n: new_order[n] for n in batch}, value=CodingNode.id, else_=CodingNode.sort_order)
+            ),
+            execution_options={"synchronize_session": False}
+        )
+
+    if moved:
+        _rebuild_closure(moved, new_parent)
+
+    if changed:
+        CodingRule.bump_revision(rule_id)
+    logger.info(f"Moved {len(moved)} and renumbered {len(changed)} nodes in rule {rule_id}")
+    return len(changed)
+
+
+def _rebuild_closure(moved, new_parent):
+    """
+    重建祖先鏈有變動的節點 (被移動節點的整棵新子樹) 的 closure 列。
+    其他節點的祖先都沒有移動，closure 列不受影響。
+    """
+    kids = {}
+    for node_id, parent_id in new_parent.items():
+        kids.setdefault(parent_id, []).append(node_id)
+
+    affected = []
+    stack = list(moved)
+    seen = set()
+    while stack:
+        node_id = stack.pop()
+        if node_id in seen:
+            continue
+        seen.add(node_id)
+        affected.append(node_id)
+        stack.extend(kids.get(node_id, []))
+
+    rows = []
+    for node_id in affected:
+        current, depth = node_id, 0
+        while current is not None:
+            rows.append({"ancestor_id": current, "descendant_id": node_id, "depth": depth})
+            current, depth = new_parent.get(current), depth + 1
+
+    for start in range(0, len(affected), UPDATE_BATCH_SIZE):
+        db.session.execute(
+            db.delete(CodingNodeClosure)
+            .where(CodingNodeClosure.descendant_id.in_(affected[start:start + UPDATE_BATCH_SIZE])),
+            execution_options={"synchronize_session": False}
+        )
+    db.session.execute(db.insert(CodingNodeClosure), rows)
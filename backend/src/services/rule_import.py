@@ -0,0 +1,289 @@
+import csv
+import io
+import logging
+import time
+from src.extensions import db
+from src.models.coding_rule import CodingNode, CodingRule, CodingNodeClosure
+from src.utils.validators import validate_regex
+
+logger = logging.getLogger(__name__)
+
+NODE_TYPES = {'STATIC', 'INPUT', 'SERIAL', 'FIXED', 'OPTION'}
+CSV_COLUMNS = ['id', 'parent_id', 'name', 'node_type', 'segment_length', 'code',
+               'value_regex', 'value_placeholder', 'sort_order', 'description']
+
+# 每個 INSERT 陳述式最多帶的列數
+INSERT_BATCH_SIZE = 1000
+
+# 回報錯誤時最多列出幾筆，避免回應過大
+MAX_REPORTED_ERRORS = 50
+
+
+class RuleImportError(Exception):
+    """匯入資料驗證失敗，errors 為所有錯誤訊息"""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} validation error(s)")
+        self.errors = errors
+
+
+def parse_json_nodes(nodes):
+    """
+    將 JSON 節點描述攤平成列表。支援兩種寫法 (可混用):
+    - 巢狀: 節點內以 "children" 陣列描述子節點
+    - 平面: 節點以 "id" 標示用戶端自訂的編號，子節點以 "parent_id" 參照該編號
+    """
+    if not isinstance(nodes, list):
+        raise RuleImportError(["nodes must be an array"])
+
+    flat = []
+    auto_ref = 0
+    stack = [(node, None) for node in reversed(nodes)]
+    while stack:
+        node, parent_ref = stack.pop()
+        if not isinstance(node, dict):
+            raise RuleImportError([f"node #{len(flat) + 1}: must be an object"])
+        item = {k: v for k, v in node.items() if k != 'children'}
+        if item.get('id') is None:
+            auto_ref += 1
+            item['id'] = f"__auto_{auto_ref}"
+        item['id'] = str(item['id'])
+        if parent_ref is not None:
+            item['parent_id'] = parent_ref
+        elif item.get('parent_id') is not None:
+            item['parent_id'] = str(item['parent_id'])
+        flat.append(item)
+
+        children = node.get('children') or []
+        if not isinstance(children, list):
+            raise RuleImportError([f"node {item['id']}: children must be an array"])
+        stack.extend((child, item['id']) for child in reversed(children))
+    return flat
+
+
+def parse_csv_nodes(text):
+    """
+    解析 CSV (第一列為標題)，欄位:
+    id, parent_id, name, node_type, segment_length, code, value_regex, value_placeholder, sort_order, description
+    id / parent_id 為用戶端自訂的編號，parent_id 留空代表根節點。
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or 'name' not in reader.fieldnames:
+        raise RuleImportError(["CSV header must include at least: id, parent_id, name, node_type, segment_length"])
+
+    flat = []
+    for row in reader:
+        item = {k: (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k in CSV_COLUMNS}
+        # 空字串視為未提供
+        item = {k: v for k, v in item.items() if v not in ('', None)}
+        if 'id' not in item:
+            item['id'] = f"__row_{reader.line_num}"
+        flat.append(item)
+    return flat
+
+
+def _to_int(value):
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, int):
+        return value
+    return int(str(value))
+
+
+def validate_rule_data(rule_data):
+    """
+    驗證新規則的欄位 ({"name", "total_length", "is_active"}，皆可省略)，回傳正規化後的 dict。
+    有任何錯誤時拋出 RuleImportError。
+    """
+    if rule_data is None:
+        return {}
+    if not isinstance(rule_data, dict):
+        raise RuleImportError(["rule must be an object"])
+
+    errors = []
+    rule_data = dict(rule_data)
+    name = rule_data.get('name')
+    if name is not None:
+        if not isinstance(name, str) or not name.strip():
+            errors.append("rule: name must be a non-empty string")
+        elif len(name) > 100:
+            errors.append("rule: name is longer than 100 characters")
+    if rule_data.get('total_length') is not None:
+        try:
+            rule_data['total_length'] = _to_int(rule_data['total_length'])
+            if rule_data['total_length'] <= 0:
+                errors.append("rule: total_length must be a positive integer")
+        except (TypeError, ValueError):
+            errors.append("rule: total_length must be a positive integer")
+    if rule_data.get('is_active') is not None and not isinstance(rule_data['is_active'], bool):
+        errors.append("rule: is_active must be a boolean")
+
+    if errors:
+        raise RuleImportError(errors)
+    return rule_data
+
+
+def validate_nodes(flat):
+    """
+    在寫入任何資料前驗證整棵樹，回傳依層級排序的節點列表 (父節點一定排在子節點之前)。
+    有任何錯誤時拋出 RuleImportError，包含所有錯誤訊息。
+    """
+    errors = []
+    by_ref = {}
+    for item in flat:
+        ref = item['id']
+        if ref in by_ref:
+            errors.append(f"node {ref}: duplicate id")
+            continue
+        by_ref[ref] = item
+
+    for ref, item in by_ref.items():
+        label = f"node {ref}"
+        name = item.get('name')
+        if not isinstance(name, str) or not name.strip():
+            errors.append(f"{label}: name is required")
+        elif len(name) > 100:
+            errors.append(f"{label}: name is longer than 100 characters")
+
+        node_type = item.get('node_type', 'STATIC')
+        if node_type not in NODE_TYPES:
+            errors.append(f"{label}: invalid node_type {node_type!r}")
+        item['node_type'] = node_type
+
+        code = item.get('code')
+        if code is not None:
+            code = item['code'] = str(code)
+            if len(code) > 20:
+                errors.append(f"{label}: code is longer than 20 characters")
+        if node_type in ('FIXED', 'OPTION') and not code:
+            errors.append(f"{label}: {node_type} nodes require a code")
+
+        if item.get('segment_length') is None and code:
+            item['segment_length'] = len(code)
+        for field in ('segment_length', 'sort_order'):
+            if item.get(field) is None:
+                continue
+            try:
+                item[field] = _to_int(item[field])
+            except (TypeError, ValueError):
+                errors.append(f"{label}: {field} must be an integer")
+        if item.get('segment_length') is None:
+            errors.append(f"{label}: segment_length is required")
+        elif isinstance(item['segment_length'], int) and item['segment_length'] < 0:
+            errors.append(f"{label}: segment_length must not be negative")
+
+        regex = item.get('value_regex')
+        if regex is not None and not validate_regex(regex):
+            errors.append(f"{label}: invalid value_regex")
+        elif regex is not None and len(regex) > 100:
+            errors.append(f"{label}: value_regex is longer than 100 characters")
+        placeholder = item.get('value_placeholder')
+        if placeholder is not None and not isinstance(placeholder, str):
+            errors.append(f"{label}: value_placeholder must be a string")
+        elif placeholder is not None and len(placeholder) > 50:
+            errors.append(f"{label}: value_placeholder is longer than 50 characters")
+        description = item.get('description')
+        if description is not None and not isinstance(description, str):
+            errors.append(f"{label}: description must be a string")
+
+        parent_ref = item.get('parent_id')
+        if parent_ref is not None:
+            parent = by_ref.get(parent_ref)
+            if parent is None:
+                errors.append(f"{label}: parent_id {parent_ref} does not exist in the import")
+            elif parent.get('node_type', 'STATIC') == 'OPTION':
+                errors.append(f"{label}: OPTION nodes cannot have children")
+            elif node_type == 'OPTION' and parent.get('node_type', 'STATIC') != 'STATIC':
+                errors.append(f"{label}: OPTION nodes must belong to a STATIC node")
+        elif node_type == 'OPTION':
+            errors.append(f"{label}: OPTION nodes must belong to a STATIC node")
+
+    if errors:
+        raise RuleImportError(errors)
+
+    # 依層級排序 (BFS)，同時偵測循環參照
+    children = {}
+    for ref, item in by_ref.items():
+        children.setdefault(item.get('parent_id'), []).append(ref)
+    ordered = []
+    level = children.get(None, [])
+    while level:
+        ordered.append([by_ref[ref] for ref in level])
+        level = [child for ref in level for child in children.get(ref, [])]
+
+    if sum(len(lvl) for lvl in ordered) != len(by_ref):
+        raise RuleImportError(["parent_id references form a cycle"])
+    return ordered
+
+
+def prepare_import(payload, fmt='json', max_nodes=None):
+    """
+    解析並驗證匯入內容 (fmt 為 'json' 時 payload 為節點陣列，'csv' 時為 CSV 文字)，
+    回傳 validate_nodes 的層級列表。
+    """
+    flat = parse_csv_nodes(payload) if fmt == 'csv' else parse_json_nodes(payload)
+    return validate_import(flat, max_nodes)
+
+
+def validate_import(flat, max_nodes=None):
+    """檢查節點數上限後驗證整棵樹 (已攤平的節點列表，例如由快照轉換而來)"""
+    if not flat:
+        raise RuleImportError(["no nodes to import"])
+    if max_nodes is not None and len(flat) > max_nodes:
+        raise RuleImportError([f"too many nodes: {len(flat)} (max {max_nodes})"])
+    return validate_nodes(flat)
+
+
+def import_rule(levels, rule_id=None, rule_data=None):
+    """
+    在單一交易中寫入整棵樹 (全部成功或全部不寫入)。
+    每一層以批次 INSERT ... RETURNING 寫入，取得資料庫 id 後建立 closure 列，再寫下一層。
+    回傳 (rule_id, 節點數, 耗時秒數)。
+    """
+    started = time.perf_counter()
+    try:
+        if rule_id is None:
+            rule_data = rule_data or {}
+            rule = CodingRule(
+                name=rule_data['name'],
+                total_length=rule_data.get('total_length', 16),
+                is_active=rule_data.get('is_active', True)
+            )
+            db.session.add(rule)
+            db.session.flush()
+            rule_id = rule.id
+        else:
+            CodingRule.bump_revision(rule_id)
+
+        db_ids = {}
+        count = 0
+        stmt = db.insert(CodingNode).returning(CodingNode.id, sort_by_parameter_order=True)
+        for level in levels:
+            for start in range(0, len(level), INSERT_BATCH_SIZE):
+                batch = level[start:start + INSERT_BATCH_SIZE]
+                rows = [{
+                    "rule_id": rule_id,
+                    "parent_id": db_ids[item['parent_id']] if item.get('parent_id') is not None else None,
+                    "name": item['name'],
+                    "segment_length": item['segment_length'],
+                    "node_type": item['node_type'],
+                    "code": item.get('code'),
+                    "value_regex": item.get('value_regex'),
+                    "value_placeholder": item.get('value_placeholder'),
+                    "sort_order": item.get('sort_order') or 0,
+                    "description": item.get('description')
+                } for item in batch]
+                new_ids = db.session.execute(stmt, rows).scalars().all()
+                CodingNodeClosure.add_nodes(new_ids)
+                for item, new_id in zip(batch, new_ids):
+                    db_ids[item['id']] = new_id
+                count += len(batch)
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Imported {count} nodes into rule {rule_id} in {elapsed:.3f}s")
+    return rule_id, count, elapsed
@@ -0,0 +1,54 @@
+import logging
+from src.extensions import db
+from src.models.coding_rule import CodingNode, CodingRule, CodingRuleVersion
+from src.utils.rule_snapshot import write_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class PublishConflict(Exception):
+    """另一個請求同時發佈了同一條規則"""
+
+
+def publish_rule(rule, user_id=None):
+    """
+    將規則目前的草稿 (coding_nodes) 凍結為新的發佈版本並 commit。
+    草稿自上次發佈後沒有變動時不建立新版本。回傳 (CodingRuleVersion, 是否為新版本)。
+    """
+    latest = None
+    if rule.published_version:
+        latest = db.session.query(
+            CodingRuleVersion.id, CodingRuleVersion.version, CodingRuleVersion.draft_revision
+        ).filter_by(rule_id=rule.id, version=rule.published_version).first()
+        if latest and latest.draft_revision == rule.revision:
+            return CodingRuleVersion.query.get(latest.id), False
+
+    nodes = CodingNode.query.filter_by(rule_id=rule.id).all()
+    snapshot = b''.join(write_snapshot(rule, nodes, compress=True, include_ids=True))
+    previous = rule.published_version
+    version = CodingRuleVersion(
+        rule_id=rule.id,
+        version=(previous or 0) + 1,
+        snapshot=snapshot,
+        node_count=len(nodes),
+        draft_revision=rule.revision,
+        published_by=user_id
+    )
+    try:
+        db.session.add(version)
+        # 以條件式 UPDATE 確保版本號依序遞增；同時發佈時只有一個請求會成功 (唯一鍵也會擋下)
+        result = db.session.execute(
+            db.update(CodingRule)
+            .where(CodingRule.id == rule.id, CodingRule.published_version.is_not_distinct_from(previous))
+            .values(published_version=version.version),
+            execution_options={"synchronize_session": False}
+        )
+        if result.rowcount != 1:
+            raise PublishConflict()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    logger.info(f"Published rule {rule.id} version {version.version} ({len(nodes)} nodes, {len(snapshot)} bytes)")
+    return version, True
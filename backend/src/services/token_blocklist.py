@@ -0,0 +1,126 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, or_
+from src.extensions import db, blocklist_cache
+from src.models.token_blocklist import TokenBlocklist
+
+logger = logging.getLogger(__name__)
+
+# 清理統計 (僅統計目前這個 worker)
+_metrics_lock = threading.Lock()
+_metrics = {
+    "sweeps": 0,
+    "purged_total": 0,
+    "last_purged": 0,
+    "last_sweep_at": None,
+    "last_sweep_seconds": None,
+    "last_error": None
+}
+
+_sweeper = None
+
+
+def _utcnow():
+    # DateTime 欄位不含時區，一律以 UTC 存放
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def token_expires_at(exp=None):
+    """Token 的 exp (epoch 秒) 轉為 expires_at；未知時以最長有效期限估計"""
+    if exp is None:
+        return _utcnow() + timedelta(seconds=blocklist_cache.token_lifetime)
+    return datetime.fromtimestamp(exp, timezone.utc).replace(tzinfo=None)
+
+
+def _expired_clause(now):
+    # 舊資料沒有 expires_at，以 created_at + Token 有效期限判斷
+    return or_(
+        TokenBlocklist.expires_at < now,
+        and_(
+            TokenBlocklist.expires_at.is_(None),
+            TokenBlocklist.created_at < now - timedelta(seconds=blocklist_cache.token_lifetime)
+        )
+    )
+
+
+def prune_expired(batch_size=1000, max_batches=None):
+    """
+    分批刪除已過期的黑名單紀錄，每批各自 commit，避免長時間鎖住資料表。
+    max_batches 為 None 時刪到沒有過期紀錄為止。回傳刪除筆數。
+    """
+    started = time.perf_counter()
+    now = _utcnow()
+    total = 0
+    batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            ids = [row.id for row in db.session.query(TokenBlocklist.id).filter(_expired_clause(now)).limit(batch_size)]
+            if not ids:
+                break
+            result = db.session.execute(
+                db.delete(TokenBlocklist).where(TokenBlocklist.id.in_(ids)),
+                execution_options={"synchronize_session": False}
+            )
+            db.session.commit()
+            total += result.rowcount
+            batches += 1
+            if len(ids) < batch_size:
+                break
+    except Exception as e:
+        db.session.rollback()
+        with _metrics_lock:
+            _metrics["last_error"] = str(e)
+        raise
+
+    elapsed = time.perf_counter() - started
+    with _metrics_lock:
+        _metrics["sweeps"] += 1
+        _metrics["purged_total"] += total
+        _metrics["last_purged"] = total
+        _metrics["last_sweep_at"] = now.replace(tzinfo=timezone.utc).isoformat()
+        _metrics["last_sweep_seconds"] = round(elapsed, 3)
+        _metrics["last_error"] = None
+    if total:
+        logger.info(f"Pruned {total} expired token_blocklist rows in {batches} batches ({elapsed:.3f}s)")
+    return total
+
+
+def blocklist_stats():
+    """黑名單資料表大小、待清理筆數與清理統計"""
+    now = _utcnow()
+    rows = db.session.query(db.func.count(TokenBlocklist.id)).scalar()
+    expired = db.session.query(db.func.count(TokenBlocklist.id)).filter(_expired_clause(now)).scalar()
+    with _metrics_lock:
+        metrics = dict(_metrics)
+    return {"table_rows": rows, "expired_rows": expired, **metrics}
+
+
+def start_sweeper(app):
+    """
+    依 JWT_BLOCKLIST_SWEEP_SECONDS 啟動背景清理執行緒 (0 表示不啟動，改用 flask prune-blocklist 排程)。
+    每個 worker 各自執行；刪除本身是冪等的，多個 worker 同時清理不會出錯。
+    """
+    global _sweeper
+    interval = app.config.get('JWT_BLOCKLIST_SWEEP_SECONDS', 0)
+    if interval <= 0 or app.testing or (_sweeper is not None and _sweeper.is_alive()):
+        return None
+
+    batch_size = app.config.get('JWT_BLOCKLIST_PRUNE_BATCH_SIZE', 1000)
+    max_batches = app.config.get('JWT_BLOCKLIST_PRUNE_MAX_BATCHES', 10)
+
+    def run():
+        while True:
+            # 加入隨機延遲，避免多個 worker 同時清理
+            time.sleep(interval + random.uniform(0, interval * 0.1))
+            try:
+                with app.app_context():
+                    prune_expired(batch_size=batch_size, max_batches=max_batches)
+            except Exception as e:
+                logger.error(f"Token blocklist sweep failed: {str(e)}")
+
+    _sweeper = threading.Thread(target=run, name='token-blocklist-sweeper', daemon=True)
+    _sweeper.start()
+    return _sweeper
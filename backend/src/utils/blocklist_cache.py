@@ -0,0 +1,115 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+
+def _to_timestamp(value):
+    # 資料庫取回的 DateTime 沒有時區資訊，寫入時一律為 UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class BlocklistCache:
+    """
+    JWT 黑名單的 process 內快取，取代每個需要驗證的請求都查一次 token_blocklist。
+    - 只保留尚未過期的 JTI (被封鎖的 Token 最晚在 created_at + Token 有效期限後過期)
+    - 每隔 refresh_seconds 以 created_at 增量載入其他 worker 新增的封鎖紀錄，
+      因此其他 worker 的登出最多延遲 refresh_seconds 秒生效
+    - 本 worker 登出時直接寫入快取，立即生效
+    """
+
+    # 增量查詢往回多看的秒數，涵蓋較晚 commit 的交易與主機間的時鐘誤差
+    REFRESH_OVERLAP_SECONDS = 30
+
+    def __init__(self, refresh_seconds=5, token_lifetime=3600, enabled=True):
+        self.refresh_seconds = refresh_seconds
+        self.token_lifetime = token_lifetime
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries = {}          # jti -> 過期時間 (epoch 秒)
+        self._watermark = None      # 已載入的最新 created_at (epoch 秒)，None 代表尚未載入
+        self._refreshed_at = 0.0
+        self.lookups = 0
+        self.revoked_hits = 0
+        self.refreshes = 0
+        self.loaded_rows = 0
+
+    def init_app(self, app):
+        self.refresh_seconds = app.config.get('JWT_BLOCKLIST_REFRESH_SECONDS', self.refresh_seconds)
+        expires = app.config.get('JWT_ACCESS_TOKEN_EXPIRES', self.token_lifetime)
+        self.token_lifetime = expires.total_seconds() if isinstance(expires, timedelta) else expires
+        self.enabled = app.config.get('JWT_BLOCKLIST_CACHE_ENABLED', self.enabled)
+        self.clear()
+
+    def is_revoked(self, jti):
+        self.lookups += 1
+        if time.monotonic() - self._refreshed_at >= self.refresh_seconds:
+            self.refresh()
+        expires_at = self._entries.get(jti)
+        if expires_at is None or expires_at < time.time():
+            return False
+        self.revoked_hits += 1
+        return True
+
+    def add(self, jti, expires_at=None):
+        """本 worker 封鎖 Token 後立即寫入 (expires_at 為 Token 的 exp，未知時以最長有效期限估計)"""
+        with self._lock:
+            self._entries[jti] = expires_at if expires_at is not None else time.time() + self.token_lifetime
+
+    def refresh(self):
+        """載入 watermark 之後新增的封鎖紀錄，並移除已過期的項目"""
+        from src.extensions import db
+        from src.models.token_blocklist import TokenBlocklist
+
+        with self._lock:
+            # 其他執行緒剛更新過就不重複查詢
+            if time.monotonic() - self._refreshed_at < self.refresh_seconds:
+                return
+            now = time.time()
+            # 比 Token 有效期限更早的紀錄，對應的 Token 都已過期
+            oldest = now - self.token_lifetime
+            since = oldest if self._watermark is None else max(oldest, self._watermark - self.REFRESH_OVERLAP_SECONDS)
+
+            query = db.session.query(TokenBlocklist.jti, TokenBlocklist.created_at, TokenBlocklist.expires_at).filter(
+                TokenBlocklist.created_at >= datetime.fromtimestamp(since, timezone.utc).replace(tzinfo=None)
+            )
+            try:
+                rows = query.all()
+            except Exception:
+                db.session.rollback()
+                raise
+
+            watermark = self._watermark if self._watermark is not None else since
+            for jti, created_at, token_expires_at in rows:
+                created = _to_timestamp(created_at)
+                # 舊資料沒有 expires_at，以 created_at + Token 有效期限估計
+                expires_at = _to_timestamp(token_expires_at) if token_expires_at is not None else created + self.token_lifetime
+                if expires_at > self._entries.get(jti, 0):
+                    self._entries[jti] = expires_at
+                watermark = max(watermark, created)
+
+            self._entries = {jti: exp for jti, exp in self._entries.items() if exp >= now}
+            self._watermark = watermark
+            self._refreshed_at = time.monotonic()
+            self.refreshes += 1
+            self.loaded_rows += len(rows)
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._watermark = None
+            self._refreshed_at = 0.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "refresh_seconds": self.refresh_seconds,
+                "lookups": self.lookups,
+                "revoked_hits": self.revoked_hits,
+                "refreshes": self.refreshes,
+                "loaded_rows": self.loaded_rows,
+                "seconds_since_refresh": round(time.monotonic() - self._refreshed_at, 3) if self._refreshed_at else None
+            }
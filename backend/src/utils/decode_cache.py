@@ -0,0 +1,101 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def _estimate_size(value):
+    """粗估快取值佔用的記憶體 (bytes)，只需要量級正確"""
+    if value is None:
+        return 16
+    if isinstance(value, str):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class DecodeCache:
+    """
+    解碼結果快取 (LRU + TTL + 記憶體上限)。
+    key 中包含規則版本號，規則變動後舊結果自然不會再被命中，之後由 LRU 淘汰。
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl=3600, enabled=True):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expires_at, size, value)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def init_app(self, app):
+        self.max_bytes = app.config.get('DECODE_CACHE_MAX_BYTES', self.max_bytes)
+        self.ttl = app.config.get('DECODE_CACHE_TTL', self.ttl)
+        self.enabled = app.config.get('DECODE_CACHE_ENABLED', self.enabled)
+        self.clear()
+
+    def get(self, key):
+        """回傳 (是否命中, 值)；值可能為 None (快取的解碼失敗結果)"""
+        if not self.enabled:
+            return False, None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        size = _estimate_size(key) + _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._bytes -= old[1]
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            # 超過記憶體上限時淘汰最久未使用的項目
+            while self._bytes > self.max_bytes:
+                _, (_, old_size, _) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
@@ -0,0 +1,135 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class DecodeStats:
+    """
+    單一請求的解碼統計:
+    - nodes_visited: 實際展開的 (節點, 剩餘長度) 組合數
+    - memo_hits: 命中記憶表而略過展開的次數
+    - backtracks: 節點匹配成功但其下找不到完整路徑、必須放棄的分支數
+    - option_comparisons: STATIC 節點比對到的 OPTION 候選數
+    - sql_statements: 此請求期間發出的 SQL 數量
+    - phases: 各階段耗時 (ms)
+    """
+    __slots__ = ('nodes_visited', 'memo_hits', 'backtracks', 'option_comparisons',
+                 'sql_statements', 'cache_hits', 'cache_misses', 'codes', 'phases', '_started')
+
+    def __init__(self):
+        self.nodes_visited = 0
+        self.memo_hits = 0
+        self.backtracks = 0
+        self.option_comparisons = 0
+        self.sql_statements = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.codes = 0
+        self.phases = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    @property
+    def wall_ms(self):
+        return (time.perf_counter() - self._started) * 1000
+
+    def to_dict(self):
+        return {
+            "codes": self.codes,
+            "nodes_visited": self.nodes_visited,
+            "memo_hits": self.memo_hits,
+            "backtracks": self.backtracks,
+            "option_comparisons": self.option_comparisons,
+            "sql_statements": self.sql_statements,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "phases_ms": {k: round(v, 3) for k, v in self.phases.items()},
+            "wall_ms": round(self.wall_ms, 3)
+        }
+
+
+class Histogram:
+    """固定區間的累積直方圖 (bounds 為各區間上限，最後一格為 +Inf)"""
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def to_dict(self):
+        labels = [str(b) for b in self.bounds] + ['+Inf']
+        return {
+            "buckets": dict(zip(labels, self.counts)),
+            "count": self.count,
+            "sum": self.total,
+            "max": self.max
+        }
+
+
+_COUNT_BOUNDS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 100000)
+_MS_BOUNDS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+# 每個 worker process 各自累積
+_lock = threading.Lock()
+_histograms = {
+    "nodes_visited": Histogram(_COUNT_BOUNDS),
+    "backtracks": Histogram(_COUNT_BOUNDS),
+    "option_comparisons": Histogram(_COUNT_BOUNDS),
+    "sql_statements": Histogram(_COUNT_BOUNDS),
+    "wall_ms": Histogram(_MS_BOUNDS),
+}
+
+
+def start_decode_stats():
+    """開始統計目前請求的解碼，之後 SQL 監聽器與 get_decode_stats 都會取得同一個物件"""
+    stats = DecodeStats()
+    g.decode_stats = stats
+    return stats
+
+
+def get_decode_stats():
+    if not has_request_context():
+        return None
+    return g.get('decode_stats')
+
+
+def finish_decode_stats(stats):
+    """將請求統計累加至 process 內的直方圖"""
+    wall_ms = stats.wall_ms
+    with _lock:
+        _histograms["nodes_visited"].observe(stats.nodes_visited)
+        _histograms["backtracks"].observe(stats.backtracks)
+        _histograms["option_comparisons"].observe(stats.option_comparisons)
+        _histograms["sql_statements"].observe(stats.sql_statements)
+        _histograms["wall_ms"].observe(wall_ms)
+
+
+def histogram_snapshot():
+    with _lock:
+        return {name: h.to_dict() for name, h in _histograms.items()}
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_sql_statement(conn, cursor, statement, parameters, context, executemany):
+    stats = get_decode_stats()
+    if stats is not None:
+        stats.sql_statements += 1
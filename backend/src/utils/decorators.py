@@ -1,3 +1,4 @@
+import time
 from functools import wraps
 from flask import jsonify
 from flask_jwt_extended import verify_jwt_in_request, get_jwt
@@ -13,3 +14,13 @@ def admin_required():
             return fn(*args, **kwargs)
         return decorator
     return wrapper
+
+def has_recent_reauth():
+    """
+    目前的 Token 是否在管理員再驗證 (sudo) 有效期內。
+    /auth/sudo 核對密碼後簽發 fresh claim 為到期時間的 Token，期間內只需驗證簽章，不必重算密碼雜湊。
+    """
+    fresh = get_jwt().get("fresh", False)
+    if isinstance(fresh, bool):
+        return fresh
+    return time.time() < fresh
@@ -1,9 +1,13 @@
-from src.extensions import jwt, db
+from src.extensions import jwt, db, blocklist_cache
 from src.models.token_blocklist import TokenBlocklist
 
 @jwt.token_in_blocklist_loader
 def check_if_token_in_blocklist(jwt_header, jwt_payload):
     jti = jwt_payload["jti"] # 拿出這張 Token 的身分證號
+
+    # 預設查 process 內的黑名單快取 (定期增量同步資料庫)，不必每個請求都查一次資料庫
+    if blocklist_cache.enabled:
+        return blocklist_cache.is_revoked(jti)
     
     # 去資料庫查，如果有找到，代表這張 Token 被封鎖了
     token = db.session.query(TokenBlocklist.id).filter_by(jti=jti).scalar()
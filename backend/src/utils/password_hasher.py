@@ -0,0 +1,132 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+
+class PasswordHashUnavailable(Exception):
+    """雜湊工作池已滿或逾時，呼叫端應回傳 503 請使用者稍後再試"""
+
+
+def _method_of(password_hash):
+    # werkzeug 的雜湊格式為 "method$salt$hash"，method 含演算法與成本參數 (例如 scrypt:32768:8:1)
+    return password_hash.split('$', 1)[0]
+
+
+def canonical_method(method):
+    """
+    以 werkzeug 的預設值補齊設定中省略的成本參數 (例如 "scrypt" -> "scrypt:32768:8:1")，
+    得到與已存雜湊前綴相同格式的字串，不必實際計算一次雜湊。
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        n, r, p = args if args else (2 ** 15, 8, 1)
+        return f"scrypt:{int(n)}:{int(r)}:{int(p)}"
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    raise ValueError(f"Unsupported PASSWORD_HASH_METHOD: {method}")
+
+
+class PasswordHasher:
+    """
+    把密碼雜湊 (scrypt / PBKDF2，CPU 密集) 移到獨立的 process pool 執行，
+    大量登入時只佔用固定數量的 CPU，其他 API 的延遲不受影響。
+    - 同時執行 + 排隊中的工作超過 workers + max_queue 時立即拒絕 (不排隊等待)
+    - 單次雜湊超過 timeout 秒視為失敗
+    - workers 為 0 時在請求執行緒中直接計算 (開發 / 測試用)
+    """
+
+    def __init__(self, method='scrypt', workers=2, max_queue=16, timeout=5.0):
+        self.method = method
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._method_prefix = None
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', self.method)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.max_queue = app.config.get('PASSWORD_HASH_MAX_QUEUE', self.max_queue)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        self.shutdown()
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+        # 啟動時就展開，設定錯誤的 PASSWORD_HASH_METHOD 會立即失敗而不是等到第一次登入
+        self._method_prefix = canonical_method(self.method)
+
+    def _get_pool(self):
+        # gunicorn 在 create_app 之後才 fork worker；pool 延後到第一次使用時建立，且每個 process 各自一個
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise PasswordHashUnavailable('Password hashing queue is full')
+        try:
+            future = self._get_pool().submit(fn, *args)
+        except BrokenProcessPool:
+            # 子 process 異常結束 (例如被 OOM killer 終止)，下次重建 pool
+            self._slots.release()
+            self.shutdown()
+            raise PasswordHashUnavailable('Password hashing pool is unavailable')
+        except Exception:
+            self._slots.release()
+            raise
+        # 逾時的工作仍會在 pool 中執行完畢，完成後才釋放名額，排隊上限因此不會被逾時繞過
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            self.timeouts += 1
+            raise PasswordHashUnavailable('Password hashing timed out')
+        except BrokenProcessPool:
+            self.shutdown()
+            raise PasswordHashUnavailable('Password hashing pool is unavailable')
+        self.completed += 1
+        return result
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """已存的雜湊演算法或成本參數與目前設定不同時回傳 True"""
+        if self._method_prefix is None:
+            self._method_prefix = canonical_method(self.method)
+        return _method_of(password_hash) != self._method_prefix
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            self._pool_pid = None
+
+    def stats(self):
+        return {
+            "method": self.method,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "timeout": self.timeout,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts
+        }
@@ -0,0 +1,162 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class MemoryBackend:
+    """
+    Token bucket 狀態存在目前這個 process 的 dict 中 (每個 worker 各自計數)。
+    key 超過 max_keys 時移除已經補滿的 bucket (補滿的 bucket 與不存在等價)。
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = {}      # key -> (tokens, updated_at)
+
+    def take(self, key, capacity, refill_rate, now):
+        """取走一個 token，回傳 (是否允許, 需等待秒數)"""
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return False, (1 - tokens) / refill_rate
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(capacity, refill_rate, now)
+            return True, 0.0
+
+    def _prune(self, capacity, refill_rate, now):
+        # 所有 bucket 都在同一個 window 內補滿，超過 window 沒有更新的 bucket 必定已補滿
+        refill_seconds = capacity / refill_rate
+        self._buckets = {
+            k: state for k, state in self._buckets.items() if now - state[1] < refill_seconds
+        }
+
+    def clear(self):
+        with self._lock:
+            self._buckets = {}
+
+
+class SqliteBackend:
+    """
+    Token bucket 狀態存在本機的 SQLite 檔案，同一台主機上的多個 gunicorn worker 共用計數。
+    每次嘗試是一個 BEGIN IMMEDIATE 交易 (讀取 + 寫回)，不經過主資料庫。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        # gunicorn --preload 在 create_app 之後才 fork worker；連線延後到第一次使用時建立，
+        # 且每個 process (及執行緒) 各自一個，不沿用 fork 前父 process 的連線
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS login_buckets ('
+                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key, capacity, refill_rate, now):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM login_buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated_at = row if row else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute(
+                'INSERT INTO login_buckets (key, tokens, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+                (key, tokens, now)
+            )
+            # 順便清掉早已補滿的 bucket，檔案不會無限成長
+            conn.execute('DELETE FROM login_buckets WHERE updated_at < ?', (now - capacity / refill_rate,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, (0.0 if allowed else (1 - tokens) / refill_rate)
+
+    def clear(self):
+        conn = self._connect()
+        conn.execute('DELETE FROM login_buckets')
+
+
+def create_backend(storage):
+    """'memory' 或 'sqlite:///path/to/file.db'"""
+    if not storage or storage == 'memory':
+        return MemoryBackend()
+    if storage.startswith('sqlite:///'):
+        return SqliteBackend(storage[len('sqlite:///'):])
+    raise ValueError(f"Unsupported LOGIN_RATE_LIMIT_STORAGE: {storage}")
+
+
+class LoginRateLimiter:
+    """
+    登入嘗試的 token bucket 限流，依帳號與來源 IP 各一個 bucket。
+    在計算密碼雜湊之前檢查，被拒絕的嘗試只花一次 dict (或本機 SQLite) 查詢，不佔用 CPU 計算雜湊。
+    每個 bucket 容量為 attempts，每 window 秒補滿。
+    """
+
+    def __init__(self, username_attempts=5, ip_attempts=20, window=60, enabled=True, backend=None):
+        self.username_attempts = username_attempts
+        self.ip_attempts = ip_attempts
+        self.window = window
+        self.enabled = enabled
+        self.backend = backend or MemoryBackend()
+        self.allowed = 0
+        self.rejected_username = 0
+        self.rejected_ip = 0
+
+    def init_app(self, app):
+        self.username_attempts = app.config.get('LOGIN_RATE_LIMIT_USERNAME_ATTEMPTS', self.username_attempts)
+        self.ip_attempts = app.config.get('LOGIN_RATE_LIMIT_IP_ATTEMPTS', self.ip_attempts)
+        self.window = app.config.get('LOGIN_RATE_LIMIT_WINDOW_SECONDS', self.window)
+        self.enabled = app.config.get('LOGIN_RATE_LIMIT_ENABLED', self.enabled)
+        self.backend = create_backend(app.config.get('LOGIN_RATE_LIMIT_STORAGE', 'memory'))
+
+    def check(self, username, ip):
+        """
+        消耗一次登入嘗試，回傳 None 表示允許，否則回傳建議的 Retry-After 秒數。
+        先檢查 IP，被 IP 限制擋下的請求不消耗帳號的額度 (避免他人藉此鎖住特定帳號)。
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+        if ip:
+            allowed, retry_after = self.backend.take(f'ip:{ip}', self.ip_attempts, self.ip_attempts / self.window, now)
+            if not allowed:
+                self.rejected_ip += 1
+                return retry_after
+        allowed, retry_after = self.backend.take(
+            f'user:{username.lower()}', self.username_attempts, self.username_attempts / self.window, now
+        )
+        if not allowed:
+            self.rejected_username += 1
+            return retry_after
+        self.allowed += 1
+        return None
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.backend).__name__,
+            "allowed": self.allowed,
+            "rejected_username": self.rejected_username,
+            "rejected_ip": self.rejected_ip
+        }
@@ -0,0 +1,417 @@
+import heapq
+import io
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+from flask import current_app
+from src.extensions import db
+from src.models.coding_rule import CodingNode, CodingRule, CodingRuleVersion
+from src.utils.rule_logic import unit_suffix_for
+from src.utils.rule_snapshot import read_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class _TrieNode:
+    __slots__ = ('children', 'items')
+
+    def __init__(self):
+        self.children = {}
+        self.items = []
+
+
+class CodeTrie:
+    """
+    OPTION 代碼的字首樹 (trie)。
+    - prefixes_of: 找出代碼為輸入字串前綴的項目 (解碼用)
+    - starting_with: 找出代碼以輸入字串開頭的項目 (自動完成用)
+    """
+    __slots__ = ('root',)
+
+    def __init__(self, entries=()):
+        self.root = _TrieNode()
+        for code, item in entries:
+            node = self.root
+            for ch in code:
+                node = node.children.setdefault(ch, _TrieNode())
+            node.items.append(item)
+
+    def prefixes_of(self, text):
+        """回傳代碼為 text 前綴的項目，代碼由長到短 (同代碼維持加入順序)"""
+        found = []
+        node = self.root
+        for ch in text:
+            node = node.children.get(ch)
+            if node is None:
+                break
+            if node.items:
+                found.append(node.items)
+        return [item for items in reversed(found) for item in items]
+
+    def starting_with(self, prefix, limit):
+        """回傳代碼以 prefix 開頭 (且比 prefix 長) 的項目，最多 limit 筆"""
+        node = self.root
+        for ch in prefix:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        results = []
+        stack = [iter(sorted(node.children.items()))]
+        while stack and len(results) < limit:
+            child = next(stack[-1], None)
+            if child is None:
+                stack.pop()
+                continue
+            _, child_node = child
+            results.extend(child_node.items[:limit - len(results)])
+            stack.append(iter(sorted(child_node.children.items())))
+        return results
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledNode:
+    """
+    編譯後的唯讀節點。
+    - options: OPTION 子節點，依代碼長度由長到短排序 (避免 "10" 錯誤匹配到 "1")
+    - option_trie: STATIC 節點的 OPTION 代碼字首樹
+    - unit_suffix: INPUT/SERIAL 數值的單位 (F/Ω/H)，依節點名稱於編譯時決定
+    - value_pattern: 預先編譯的 value_regex
+    - children: 非 OPTION 子節點，依 sort_order 排序
+    """
+    id: int
+    rule_id: int
+    parent_id: int | None
+    name: str
+    node_type: str
+    segment_length: int
+    code: str | None
+    value_regex: str | None
+    value_placeholder: str | None
+    sort_order: int
+    unit_suffix: str = ''
+    value_pattern: re.Pattern | None = None
+    options: tuple = ()
+    option_trie: CodeTrie | None = None
+    children: tuple = ()
+
+
+class RootIndex:
+    """
+    根節點分派索引: 依代碼的第一個字元找出可能匹配的根節點，
+    避免每次解碼都要逐一嘗試所有規則的根節點。
+    - FIXED 根節點: 以自身代碼的第一個字元為 key
+    - STATIC 根節點: 以每個 OPTION 代碼的第一個字元為 key
+    - INPUT/SERIAL 根節點: 任何字元都可能匹配，只依長度篩選
+    """
+    __slots__ = ('roots', 'by_char', 'wildcard')
+
+    def __init__(self, roots=()):
+        self.roots = tuple(roots)
+        by_char = {}
+        wildcard = []
+        for pos, root in enumerate(self.roots):
+            if root.node_type == 'FIXED':
+                keys = {root.code[0]} if root.code else set()
+            elif root.node_type == 'STATIC':
+                keys = {opt.code[0] for opt in root.options if opt.code}
+            elif root.node_type in ('INPUT', 'SERIAL'):
+                wildcard.append((pos, root.segment_length, root))
+                continue
+            else:
+                continue
+            for key in keys:
+                by_char.setdefault(key, []).append((pos, root))
+
+        self.by_char = {k: tuple(v) for k, v in by_char.items()}
+        self.wildcard = tuple(wildcard)
+
+    def candidates(self, code):
+        """回傳可能匹配此代碼的根節點，維持原本的嘗試順序"""
+        if not code:
+            return []
+        keyed = self.by_char.get(code[0], ())
+        wild = [(pos, root) for pos, length, root in self.wildcard if length <= len(code)]
+        if not wild:
+            return [root for _, root in keyed]
+        return [root for _, root in heapq.merge(keyed, wild, key=lambda x: x[0])]
+
+    def prefix_candidates(self, prefix):
+        """自動完成用: 回傳可能以 prefix 開頭的根節點 (INPUT/SERIAL 不依長度篩選)"""
+        if not prefix:
+            return list(self.roots)
+        keyed = self.by_char.get(prefix[0], ())
+        wild = [(pos, root) for pos, _, root in self.wildcard]
+        return [root for _, root in heapq.merge(keyed, wild, key=lambda x: x[0])]
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledRule:
+    id: int
+    name: str
+    total_length: int
+    is_active: bool
+    revision: int = 1
+    published_version: int = None   # None 代表由草稿編譯
+    roots: tuple = ()
+    index: RootIndex = RootIndex()
+
+    @property
+    def cache_key(self):
+        """
+        識別這份編譯結果的版本，作為解碼結果快取 key 的一部分。
+        發佈版本不可修改，key 在所有 worker 間一致且永遠有效；草稿以 revision 區分。
+        """
+        return f"p{self.published_version}" if self.published_version else f"r{self.revision}"
+
+
+def _compile_pattern(node):
+    if not node.value_regex:
+        return None
+    try:
+        return re.compile(node.value_regex)
+    except re.error as e:
+        # 舊資料中的錯誤規則不應讓整條規則無法解碼，略過該限制
+        logger.warning(f"Ignoring invalid value_regex on node {node.id}: {str(e)}")
+        return None
+
+
+def compile_rule(rule, nodes, published_version=None):
+    """
+    將一條規則的所有節點 (一次查詢取得的平面列表，或發佈快照中的節點) 組成記憶體中的唯讀樹。
+    """
+    by_parent = {}
+    for n in sorted(nodes, key=lambda x: x.id):
+        by_parent.setdefault(n.parent_id, []).append(n)
+
+    def build(n):
+        kids = by_parent.get(n.id, [])
+        options = [k for k in kids if k.node_type == 'OPTION']
+        # sort 為穩定排序，同長度的代碼維持建立順序
+        options.sort(key=lambda x: len(x.code or ''), reverse=True)
+        children = [k for k in kids if k.node_type != 'OPTION']
+        children.sort(key=lambda x: x.sort_order or 0)
+        compiled_options = tuple(build(k) for k in options)
+
+        return CompiledNode(
+            id=n.id,
+            rule_id=n.rule_id,
+            parent_id=n.parent_id,
+            name=n.name,
+            node_type=n.node_type,
+            segment_length=n.segment_length,
+            code=n.code,
+            value_regex=n.value_regex,
+            value_placeholder=n.value_placeholder,
+            sort_order=n.sort_order or 0,
+            unit_suffix=unit_suffix_for(n.name),
+            value_pattern=_compile_pattern(n),
+            options=compiled_options,
+            option_trie=CodeTrie((o.code, o) for o in compiled_options if o.code) if compiled_options else None,
+            children=tuple(build(k) for k in children),
+        )
+
+    roots = tuple(build(r) for r in sorted(by_parent.get(None, []), key=lambda x: x.sort_order or 0))
+    return CompiledRule(
+        id=rule.id,
+        name=rule.name,
+        total_length=rule.total_length,
+        # is_active 為 NULL 的舊資料視為啟用
+        is_active=rule.is_active is not False,
+        revision=rule.revision or 1,
+        published_version=published_version,
+        roots=roots,
+        index=RootIndex(roots),
+    )
+
+
+def load_compiled_rule(stream, published_version=None):
+    """不經資料庫，直接將快照 (file-like) 編譯為可供 decode_code / decode_all 使用的 CompiledRule"""
+    rule, nodes = read_snapshot(stream)
+    return compile_rule(rule, nodes, published_version=published_version)
+
+
+# 每個 worker process 各自持有一份編譯結果；
+# 其他 worker 的修改 (草稿 revision、新的發佈版本) 透過定期比對 coding_rules 發現。
+# 已發佈的規則只由發佈快照編譯，草稿的修改不會讓它重新載入。
+_lock = threading.Lock()
+_rules = None       # dict: rule_id -> CompiledRule，None 代表尚未載入
+_index = None       # 所有可解碼規則的 RootIndex
+_stale = set()      # 需要重新確認的 rule_id
+_generation = 0     # 任何一條規則的編譯結果換掉時遞增 (未指定 rule_id 的解碼使用)
+_checked_at = 0.0   # 上次比對資料庫的時間
+_EMPTY_INDEX = RootIndex()
+
+
+def _compile_published(rule, snapshot):
+    _, nodes = read_snapshot(io.BytesIO(snapshot))
+    return compile_rule(rule, nodes, published_version=rule.published_version)
+
+
+def _load_all():
+    rules = CodingRule.query.order_by(CodingRule.id).all()
+
+    # 已發佈的規則: 一次查詢取得所有最新發佈版本的快照
+    snapshots = dict(db.session.query(CodingRuleVersion.rule_id, CodingRuleVersion.snapshot).join(
+        CodingRule,
+        (CodingRule.id == CodingRuleVersion.rule_id) & (CodingRule.published_version == CodingRuleVersion.version)
+    ).all())
+
+    # 尚未發佈的規則: 一次查詢取得草稿節點
+    draft_ids = [r.id for r in rules if not r.published_version]
+    nodes_by_rule = {}
+    if draft_ids:
+        for n in CodingNode.query.filter(CodingNode.rule_id.in_(draft_ids)).all():
+            nodes_by_rule.setdefault(n.rule_id, []).append(n)
+
+    compiled = {}
+    for r in rules:
+        if r.published_version and r.id in snapshots:
+            compiled[r.id] = _compile_published(r, snapshots[r.id])
+        else:
+            compiled[r.id] = compile_rule(r, nodes_by_rule.get(r.id, []))
+    return compiled
+
+
+def _is_current(compiled, revision, published_version, is_active):
+    if compiled is None or compiled.is_active != (is_active is not False):
+        return False
+    if published_version:
+        return compiled.published_version == published_version
+    return compiled.published_version is None and compiled.revision == (revision or 1)
+
+
+def _load_one(rule_id, current):
+    """重新確認一條規則；編譯結果仍是最新 (例如已發佈規則的草稿被修改) 時沿用原物件"""
+    rule = CodingRule.query.get(rule_id)
+    if not rule:
+        return None
+    if _is_current(current, rule.revision, rule.published_version, rule.is_active):
+        return current
+    if rule.published_version:
+        snapshot = db.session.query(CodingRuleVersion.snapshot).filter_by(
+            rule_id=rule_id, version=rule.published_version
+        ).scalar()
+        if snapshot is not None:
+            return _compile_published(rule, snapshot)
+    return compile_rule(rule, CodingNode.query.filter_by(rule_id=rule_id).all())
+
+
+def _revalidate():
+    """
+    比對資料庫中每條規則的 revision / 發佈版本 / 啟用狀態，將其他 worker 已修改 (或新增、刪除) 的規則標記為過期。
+    只查 coding_rules 的欄位，不載入節點。
+    """
+    rows = db.session.query(
+        CodingRule.id, CodingRule.revision, CodingRule.published_version, CodingRule.is_active
+    ).all()
+    for rule_id, revision, published_version, is_active in rows:
+        if not _is_current(_rules.get(rule_id), revision, published_version, is_active):
+            _stale.add(rule_id)
+    current = {row[0] for row in rows}
+    _stale.update(rule_id for rule_id in _rules if rule_id not in current)
+
+
+def _decodable(rule):
+    if not rule.is_active:
+        return False
+    return bool(rule.published_version) or not current_app.config.get('DECODE_REQUIRE_PUBLISHED', False)
+
+
+def _ensure_loaded():
+    global _rules, _index, _checked_at, _generation
+    interval = current_app.config.get('RULE_CACHE_REVALIDATE_SECONDS', 0)
+    with _lock:
+        now = time.monotonic()
+        if _rules is None:
+            _rules = _load_all()
+            _index = None
+            _stale.clear()
+            _checked_at = now
+            _generation += 1
+        elif interval > 0 and now - _checked_at >= interval:
+            _revalidate()
+            _checked_at = now
+
+        if _stale:
+            rules = dict(_rules)
+            changed = False
+            for rule_id in _stale:
+                current = rules.get(rule_id)
+                compiled = _load_one(rule_id, current)
+                if compiled is current:
+                    continue
+                changed = True
+                if compiled:
+                    rules[rule_id] = compiled
+                else:
+                    rules.pop(rule_id, None)
+            _stale.clear()
+            if changed:
+                _rules = dict(sorted(rules.items()))
+                _index = None
+                _generation += 1
+        if _index is None:
+            _index = RootIndex([root for rule in _rules.values() if _decodable(rule) for root in rule.roots])
+        return _rules, _index
+
+
+def get_compiled_rules():
+    """
+    取得所有已編譯規則 (依 rule id 排序)。
+    暖機後不會再發出任何 SQL，直到有規則被 invalidate_rule 標記為過期。
+    """
+    return list(_ensure_loaded()[0].values())
+
+
+def get_compiled_rule(rule_id):
+    return _ensure_loaded()[0].get(rule_id)
+
+
+def get_compiled_roots():
+    """依規則順序回傳所有規則的根節點"""
+    return [root for rule in get_compiled_rules() for root in rule.roots]
+
+
+def get_root_index(rule_id=None):
+    """
+    取得根節點分派索引 (已排除停用的規則，以及 DECODE_REQUIRE_PUBLISHED 時尚未發佈的規則)。
+    指定 rule_id 時只回傳該規則的索引；規則不存在或不可解碼則回傳空索引。
+    """
+    rules, index = _ensure_loaded()
+    if rule_id is None:
+        return index
+    rule = rules.get(rule_id)
+    if not rule or not _decodable(rule):
+        return _EMPTY_INDEX
+    return rule.index
+
+
+def get_rule_version(rule_id=None):
+    """
+    取得規則版本，作為解碼結果快取 key 的一部分。
+    指定 rule_id 時回傳該規則編譯結果的 cache_key；未指定時回傳全域版本 (任一規則的編譯結果換掉都會改變)。
+    規則不存在或不可解碼 (停用、尚未發佈) 時回傳 0，與 get_root_index 的空索引一致，
+    停用前快取的解碼結果因此不會再被命中。
+    會先確認快取是否需要重新比對，確保取得的版本已反映其他 worker 的修改。
+    """
+    rules, _ = _ensure_loaded()
+    if rule_id is None:
+        return _generation
+    rule = rules.get(rule_id)
+    return rule.cache_key if rule and _decodable(rule) else 0
+
+
+def invalidate_rule(rule_id):
+    """規則、節點或發佈版本有變動時呼叫，下次解碼前重新確認該規則 (編譯結果仍是最新時不會重新編譯)"""
+    with _lock:
+        _stale.add(rule_id)
+
+
+def clear_cache():
+    global _rules, _index
+    with _lock:
+        _rules = None
+        _index = None
+        _stale.clear()
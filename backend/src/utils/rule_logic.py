@@ -1,6 +1,59 @@
 import re
-from src.models.coding_rule import CodingNode
+from functools import lru_cache
 
+# 單位字元對應的顯示前綴與 SI 次方 (10 的幾次方)
+VALUE_UNITS = {
+    'R': ('', 0), 'K': ('k', 3), 'M': ('M', 6),
+    'U': ('µ', -6), 'N': ('n', -9), 'P': ('p', -12)
+}
+
+# Regex: 匹配 "數字(可選) + 單位字元(RKMUNP) + 數字(可選)"
+VALUE_PATTERN = re.compile(r'^(\d*)([RKMUNP])(\d*)$', re.IGNORECASE)
+
+# 解析快取的最大筆數 (每個 worker process 各自一份)
+VALUE_CACHE_SIZE = 4096
+
+def _parse_value_parts(code_str):
+    """
+    解析數值代碼，回傳 (數值, 單位字元大寫) 或 None。
+    數值為單位前綴下的值，例如 4K7 -> (4.7, 'K')。
+    """
+    if not code_str:
+        return None
+
+    match = VALUE_PATTERN.match(code_str)
+    if not match:
+        return None
+    left, unit_char, right = match.groups()
+
+    # 防呆: 必須至少有一邊有數字
+    if not left and not right:
+        return None
+    unit_char = unit_char.upper()
+
+    # 特殊處理: 當單位在最後面 (right 為空) 且左邊是 3 位數時
+    # 需要區分 "直讀法" (100U -> 100) 與 "EIA指數法" (102U -> 1000)
+    if not right and len(left) == 3 and left.isdigit():
+        # 啟發式規則:
+        # 1. 以 '0' 開頭或結尾 -> 直讀法 (010, 100)
+        # 2. 其他 -> EIA 指數法 (102 = 10 * 10^2)
+        if left.startswith('0') or left.endswith('0'):
+            return float(left), unit_char
+        try:
+            base = int(left[:2])
+            multiplier = int(left[2])
+            return float(base * (10 ** multiplier)), unit_char
+        except ValueError:
+            return float(left), unit_char
+
+    # 一般 BS 1852 格式組合: 左邊 + . + 右邊
+    val_str = f"{left}.{right}" if right else left
+    try:
+        return float(val_str), unit_char
+    except ValueError:
+        return None
+
+@lru_cache(maxsize=VALUE_CACHE_SIZE)
 def parse_electronic_value(code_str):
     """
     解析電子元件數值代碼 (符合 BS 1852 / IEC 60062 / EIA 3-digit 標準)。
@@ -15,85 +68,72 @@ def parse_electronic_value(code_str):
     - 102U -> 1000µ (EIA 指數法: 10 * 10^2)
     - 100U -> 100µ (直讀法)
     """
-    if not code_str:
+    parts = _parse_value_parts(code_str)
+    if parts is None:
         return code_str
-        
-    units = {
-        'R': '', 'K': 'k', 'M': 'M', 
-        'U': 'µ', 'u': 'µ', 
-        'N': 'n', 'P': 'p'
-    }
-    
-    # Regex: 匹配 "數字(可選) + 單位字元(RKMUNP) + 數字(可選)"
-    match = re.match(r'^(\d*)([RKMUNP])(\d*)$', code_str, re.IGNORECASE)
-    if match:
-        left, unit_char, right = match.groups()
-        
-        # 防呆: 必須至少有一邊有數字
-        if not left and not right:
-            return code_str
-            
-        unit_suffix = units.get(unit_char.upper(), '')
-
-        # 特殊處理: 當單位在最後面 (right 為空) 且左邊是 3 位數時
-        # 需要區分 "直讀法" (100U -> 100) 與 "EIA指數法" (102U -> 1000)
-        if not right and len(left) == 3 and left.isdigit():
-            # 啟發式規則:
-            # 1. 以 '0' 開頭或結尾 -> 直讀法 (010, 100)
-            # 2. 其他 -> EIA 指數法 (102 = 10 * 10^2)
-            if left.startswith('0') or left.endswith('0'):
-                val_float = float(left)
-            else:
-                try:
-                    base = int(left[:2])
-                    multiplier = int(left[2])
-                    val_float = float(base * (10 ** multiplier))
-                except ValueError:
-                    val_float = float(left)
-            
-            val_formatted = f"{val_float:g}"
-            return f"{val_formatted}{unit_suffix}"
+    val_float, unit_char = parts
 
-        # 一般 BS 1852 格式組合: 左邊 + . + 右邊
-        val_str = f"{left}.{right}" if right else left
-        if not val_str: val_str = "0"
-        
-        try:
-            val_float = float(val_str)
-            
-            # 針對電阻 R 開頭且數值小於 1 的情況，轉換為 m (milli) 單位
-            # 例如 R010 -> 0.01 -> 10m
-            if unit_char.upper() == 'R' and 0 < val_float < 1:
-                val_formatted = f"{val_float * 1000:g}"
-                return f"{val_formatted}m"
-
-            # 格式化: 移除多餘的 .0 (例如 4.70 -> 4.7)
-            val_formatted = f"{val_float:g}"
-            
-            return f"{val_formatted}{unit_suffix}"
-        except ValueError:
-            return code_str
-            
-    return code_str
+    # 針對電阻 R 開頭且數值小於 1 的情況，轉換為 m (milli) 單位
+    # 例如 R010 -> 0.01 -> 10m
+    if unit_char == 'R' and 0 < val_float < 1:
+        return f"{val_float * 1000:g}m"
+
+    # 格式化: 移除多餘的 .0 (例如 4.70 -> 4.7)
+    return f"{val_float:g}{VALUE_UNITS[unit_char][0]}"
+
+@lru_cache(maxsize=VALUE_CACHE_SIZE)
+def electronic_value_si(code_str):
+    """
+    將數值代碼轉為 SI 基本單位的浮點數 (例如 4K7 -> 4700.0, 04U7 -> 4.7e-06)。
+    無法解析時回傳 NaN。
+    """
+    parts = _parse_value_parts(code_str)
+    if parts is None:
+        return float('nan')
+    val_float, unit_char = parts
+    exponent = VALUE_UNITS[unit_char][1]
+    # 負次方用除法，避免 100 * 1e-6 這類的浮點誤差
+    return val_float * 10.0 ** exponent if exponent >= 0 else val_float / 10.0 ** -exponent
+
+def parse_electronic_values(codes):
+    """
+    批次將數值代碼轉為 SI 浮點數，回傳與 codes 同順序的 list (無法解析者為 None)。
+    BOM 中的數值大量重複，每個不同的代碼只解析一次 (electronic_value_si 另有跨請求的 lru_cache)。
+    """
+    parsed = {}
+    for code in codes:
+        if code not in parsed:
+            value = electronic_value_si(code)
+            parsed[code] = None if value != value else value
+    return [parsed[code] for code in codes]
+
+def unit_suffix_for(node_name):
+    """根據節點名稱決定數值的單位 (編譯規則時每個節點只計算一次)"""
+    name_lower = (node_name or '').lower()
+    if 'capacit' in name_lower or '電容' in name_lower:
+        return 'F'
+    elif 'resist' in name_lower or '電阻' in name_lower:
+        return 'Ω'
+    elif 'induct' in name_lower or '電感' in name_lower:
+        return 'H'
+    return ''
 
 def match_node(node, code):
     """
-    檢查單一節點是否匹配給定的代碼片段。
+    檢查單一節點 (CompiledNode) 是否匹配給定的代碼片段。
     回傳匹配結果 (數值、意義、剩餘代碼) 或 None。
     """
     if node.node_type == 'STATIC':
         # STATIC 節點本身不匹配值，而是看它的 OPTION 子節點是否匹配
-        options = CodingNode.query.filter_by(parent_id=node.id, node_type='OPTION').all()
-        # 排序: 優先匹配較長的代碼 (避免 "10" 錯誤匹配到 "1")
-        options.sort(key=lambda x: len(x.code or ''), reverse=True)
-        
-        for opt in options:
-            if opt.code and code.startswith(opt.code):
-                return {
-                    "value": opt.code,
-                    "meaning": opt.name,
-                    "remaining": code[len(opt.code):]
-                }
+        # 以 OPTION 字首樹找出匹配的代碼 (優先匹配較長的代碼)
+        matched = node.option_trie.prefixes_of(code) if node.option_trie else []
+        if matched:
+            opt = matched[0]
+            return {
+                "value": opt.code,
+                "meaning": opt.name,
+                "remaining": code[len(opt.code):]
+            }
         return None
 
     elif node.node_type == 'FIXED':
@@ -109,21 +149,17 @@ def match_node(node, code):
         length = node.segment_length
         if len(code) >= length:
             val = code[:length]
+
+            # value_regex 不符合時直接剪枝，不再往下一層展開
+            if node.value_pattern and not node.value_pattern.fullmatch(val):
+                return None
+
             meaning = val
             
-            # 嘗試解析電子元件數值格式
+            # 嘗試解析電子元件數值格式，單位 (F/Ω/H) 於編譯時已依節點名稱決定
             formatted_val = parse_electronic_value(val)
             if formatted_val != val:
-                name_lower = node.name.lower()
-                # 根據節點名稱賦予單位
-                if 'capacit' in name_lower or '電容' in name_lower:
-                    meaning = f"{formatted_val}F"
-                elif 'resist' in name_lower or '電阻' in name_lower:
-                    meaning = f"{formatted_val}Ω"
-                elif 'induct' in name_lower or '電感' in name_lower:
-                    meaning = f"{formatted_val}H"
-                else:
-                    meaning = formatted_val
+                meaning = f"{formatted_val}{node.unit_suffix}"
 
             return {
                 "value": val,
@@ -134,43 +170,173 @@ def match_node(node, code):
     
     return None
 
-def attempt_decode_chain(node, code):
+def match_node_all(node, code):
     """
-    遞迴嘗試解碼整串代碼。
-    從當前節點開始，尋找一條能完全消耗代碼的路徑。
+    與 match_node 相同，但回傳所有可能的匹配 (STATIC 節點可能有多個 OPTION 同時符合，
+    例如 "1" 與 "10")，依優先順序排列。
     """
-    # 1. 檢查當前節點是否匹配
+    if node.node_type == 'STATIC':
+        if not node.option_trie:
+            return []
+        return [
+            {
+                "value": opt.code,
+                "meaning": opt.name,
+                "remaining": code[len(opt.code):]
+            }
+            for opt in node.option_trie.prefixes_of(code)
+        ]
     match_data = match_node(node, code)
-    if not match_data:
+    return [match_data] if match_data else []
+
+def _decode_paths(node, code, memo, limit, stats=None):
+    """
+    回傳從 node 開始、能完全消耗 code 的路徑 (每條路徑為 segment tuple)，最多 limit 條。
+    以 (節點物件, 剩餘長度) 做記憶化，同一組合只會展開一次，
+    因此成本上限為 節點數 × 代碼長度，而不是隨重疊的 INPUT/SERIAL 分支指數成長。
+    同一個 memo 必須搭配相同的 limit 使用。
+    stats (DecodeStats) 不為 None 時會累計展開節點數、回溯次數等統計。
+    """
+    # 以編譯後的節點物件識別，不用 node.id: 離線載入的快照 (不含原始 id) 各自從 1 編號，不同規則的 id 會重複
+    key = (id(node), len(code))
+    if key in memo:
+        if stats:
+            stats.memo_hits += 1
+        return memo[key]
+
+    matches = match_node_all(node, code)
+    if stats:
+        stats.nodes_visited += 1
+        if node.node_type == 'STATIC':
+            stats.option_comparisons += len(matches)
+
+    paths = []
+    for match_data in matches:
+        segment = {
+            "node_name": node.name,
+            "value": match_data['value'],
+            "meaning": match_data['meaning'],
+            "type": node.node_type
+        }
+        remaining_code = match_data['remaining']
+        found = len(paths)
+
+        # 沒有子節點時，只有剛好消耗完代碼才算成功
+        if not node.children:
+            if remaining_code == '':
+                paths.append((segment,))
+        else:
+            # 深度優先嘗試子節點 (編譯時已排除 OPTION 並依 sort_order 排序)
+            for child in node.children:
+                for tail in _decode_paths(child, remaining_code, memo, limit, stats):
+                    paths.append((segment,) + tail)
+                    if len(paths) >= limit:
+                        break
+                if len(paths) >= limit:
+                    break
+        if stats and len(paths) == found:
+            stats.backtracks += 1
+        if len(paths) >= limit:
+            break
+
+    memo[key] = paths
+    return paths
+
+def attempt_decode_chain(node, code, memo=None, stats=None):
+    """
+    遞迴嘗試解碼整串代碼。
+    從當前節點開始，尋找一條能完全消耗代碼的路徑 (深度優先，回傳第一條)。
+    """
+    paths = _decode_paths(node, code, {} if memo is None else memo, 1, stats)
+    if not paths:
         return None
-    
-    current_segment = {
-        "node_name": node.name,
-        "value": match_data['value'],
-        "meaning": match_data['meaning'],
-        "type": node.node_type
-    }
-    
-    segments = [current_segment]
-    remaining_code = match_data['remaining']
-    
-    # 2. 尋找下一層節點 (排除 OPTION，因為 OPTION 是用來匹配 STATIC 的)
-    children = CodingNode.query.filter(
-        CodingNode.parent_id == node.id,
-        CodingNode.node_type != 'OPTION'
-    ).order_by(CodingNode.sort_order).all()
-    
-    # 如果沒有子節點，且代碼還有剩餘，這裡視為此路徑結束 (由上層判斷是否完全匹配)
-    if not children:
-        return {"segments": segments, "remaining": remaining_code}
-    
-    # 3. 嘗試匹配任何一個子節點 (深度優先搜尋)
-    for child in children:
-        child_result = attempt_decode_chain(child, remaining_code)
-        if child_result:
-            return {
-                "segments": segments + child_result['segments'],
-                "remaining": child_result['remaining']
-            }
-            
-    return None
\ No newline at end of file
+    return {"segments": list(paths[0]), "remaining": ''}
+
+def decode_code(code, roots, stats=None):
+    """
+    依序從每個根節點嘗試解碼，回傳第一個能完全消耗代碼的結果，否則回傳 None。
+    """
+    # 同一次解碼中各根節點共用記憶表 (以節點物件為 key，跨規則也不會混淆)
+    memo = {}
+    for root in roots:
+        result = attempt_decode_chain(root, code, memo, stats)
+        if result:
+            return result
+    return None
+
+def decode_all(code, roots, limit, stats=None):
+    """
+    回傳所有能完全消耗代碼的解讀 (最多 limit 筆)，用於找出有歧義的代碼。
+    每筆為 {"rule_id": ..., "segments": [...]}。
+    """
+    memo = {}
+    results = []
+    for root in roots:
+        for path in _decode_paths(root, code, memo, limit, stats):
+            results.append({"rule_id": root.rule_id, "segments": list(path)})
+            if len(results) >= limit:
+                return results
+    return results
+
+def _segment_suggestions(node, typed, limit):
+    """
+    列出此節點尚未輸入完成的片段候選值 (typed 為此片段已輸入的部分)。
+    回傳 (值, 意義, 是否為佔位符) 的列表。
+    """
+    if node.node_type == 'STATIC':
+        if not node.option_trie:
+            return []
+        return [(opt.code, opt.name, False) for opt in node.option_trie.starting_with(typed, limit)]
+
+    elif node.node_type == 'FIXED':
+        if node.code and node.code.startswith(typed) and len(node.code) > len(typed):
+            return [(node.code, node.name, False)]
+        return []
+
+    elif node.node_type in ['INPUT', 'SERIAL']:
+        if len(typed) < node.segment_length:
+            placeholder = node.value_placeholder or '_' * node.segment_length
+            return [(placeholder, node.name, True)]
+        return []
+
+    return []
+
+def complete_prefix(prefix, roots, limit):
+    """
+    自動完成: 根據已輸入的部分代碼，列出所有可能的下一個片段及其意義。
+    FIXED/OPTION 代碼由字首樹提供，INPUT/SERIAL 以 value_placeholder 顯示。
+    每筆結果的 offset 為該片段在 prefix 中開始的位置。
+    """
+    results = []
+    visited = set()
+
+    def visit(node, offset):
+        if len(results) >= limit or (id(node), offset) in visited:
+            return
+        visited.add((id(node), offset))
+        typed = prefix[offset:]
+
+        # 1. 片段尚未輸入完成: 提供候選值
+        for value, meaning, is_placeholder in _segment_suggestions(node, typed, limit - len(results)):
+            results.append({
+                "rule_id": node.rule_id,
+                "node_id": node.id,
+                "node_name": node.name,
+                "type": node.node_type,
+                "value": value,
+                "meaning": meaning,
+                "is_placeholder": is_placeholder,
+                "segment_length": node.segment_length,
+                "offset": offset
+            })
+
+        # 2. 片段已完整輸入: 繼續往下一層找
+        if typed:
+            for match_data in match_node_all(node, typed):
+                consumed = len(typed) - len(match_data['remaining'])
+                for child in node.children:
+                    visit(child, offset + consumed)
+
+    for root in roots:
+        visit(root, 0)
+    return results[:limit]
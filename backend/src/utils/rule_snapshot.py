@@ -0,0 +1,317 @@
+import struct
+import zlib
+from collections import namedtuple
+
+# 規則快照 (.crsnap) 格式，用於在環境間搬移規則及離線解碼站直接載入:
+#
+#     header : b'CRSN' | version (u8) | flags (u8, bit0 = 本文以 zlib 壓縮, bit1 = 保留原始節點 id)
+#     body   : rule_id, name, total_length, is_active, revision, node_count
+#              之後每個節點 (依原始 id 排序):
+#              [id 與前一節點 id 的差值 (僅 bit1)], parent, name, node_type, segment_length, code,
+#              value_regex, value_placeholder, description, sort_order
+#     trailer: 未壓縮本文的 CRC32 (u32, big-endian)
+#
+# 整數皆為 varint (有號整數以 zigzag 編碼)；parent 為 0 代表根節點，否則為父節點在快照中的位置 + 1。
+# 字串以出現順序內嵌去重: 0 = None，1 = 新字串 (varint 長度 + UTF-8)，n >= 2 = 第 n - 2 個已出現的字串。
+
+MAGIC = b'CRSN'
+VERSION = 1
+FLAG_COMPRESSED = 0x01
+FLAG_NODE_IDS = 0x02
+_KNOWN_FLAGS = FLAG_COMPRESSED | FLAG_NODE_IDS
+
+# 單一字串上限，避免損毀的檔案造成超大配置
+MAX_STRING_BYTES = 1 << 20
+
+_CHUNK_SIZE = 64 * 1024
+_CRC = struct.Struct('>I')
+
+SnapshotNode = namedtuple('SnapshotNode', [
+    'id', 'rule_id', 'parent_id', 'name', 'node_type', 'segment_length', 'code',
+    'value_regex', 'value_placeholder', 'sort_order', 'description'
+])
+SnapshotRule = namedtuple('SnapshotRule', ['id', 'name', 'total_length', 'is_active', 'revision'])
+
+
+class SnapshotError(ValueError):
+    """快照格式錯誤或內容損毀"""
+
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(value):
+    return _varint((value << 1) ^ (value >> 63))
+
+
+class _Writer:
+    """累積本文並以固定大小的區塊輸出 (必要時壓縮)"""
+
+    def __init__(self, compress):
+        self._compressor = zlib.compressobj(6) if compress else None
+        self._buffer = bytearray()
+        self._strings = {}
+        self.crc = 0
+
+    def write(self, data):
+        self.crc = zlib.crc32(data, self.crc)
+        self._buffer += data
+
+    def string(self, value):
+        if value is None:
+            self.write(b'\x00')
+            return
+        ref = self._strings.get(value)
+        if ref is not None:
+            self.write(_varint(ref + 2))
+            return
+        self._strings[value] = len(self._strings)
+        encoded = value.encode('utf-8')
+        self.write(b'\x01' + _varint(len(encoded)) + encoded)
+
+    def drain(self, final=False):
+        """取出目前可輸出的位元組；未達區塊大小且非結尾時回傳空 bytes"""
+        if not final and len(self._buffer) < _CHUNK_SIZE:
+            return b''
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+            if final:
+                data += self._compressor.flush()
+        return data
+
+
+def write_snapshot(rule, nodes, compress=True, include_ids=False):
+    """
+    將規則與其所有節點 (一次查詢取得的平面列表) 編碼為快照，以產生器逐塊輸出。
+    include_ids 為 True 時保留原始節點 id (發佈版本使用，讓解碼結果的 node_id 與資料庫一致)。
+    """
+    nodes = sorted(nodes, key=lambda x: x.id)
+    positions = {n.id: i for i, n in enumerate(nodes)}
+
+    flags = (FLAG_COMPRESSED if compress else 0) | (FLAG_NODE_IDS if include_ids else 0)
+    yield MAGIC + bytes([VERSION, flags])
+
+    w = _Writer(compress)
+    w.write(_varint(rule.id))
+    w.string(rule.name)
+    w.write(_zigzag(rule.total_length if rule.total_length is not None else 16))
+    w.write(b'\x00' if rule.is_active is False else b'\x01')
+    w.write(_varint(rule.revision or 1))
+    w.write(_varint(len(nodes)))
+
+    previous_id = 0
+    for n in nodes:
+        if include_ids:
+            w.write(_varint(n.id - previous_id))
+            previous_id = n.id
+        parent = positions.get(n.parent_id)
+        w.write(_varint(0 if parent is None else parent + 1))
+        w.string(n.name)
+        w.string(n.node_type)
+        w.write(_zigzag(n.segment_length))
+        w.string(n.code)
+        w.string(n.value_regex)
+        w.string(n.value_placeholder)
+        w.string(n.description)
+        w.write(_zigzag(n.sort_order or 0))
+        chunk = w.drain()
+        if chunk:
+            yield chunk
+
+    crc = w.crc
+    chunk = w.drain(final=True)
+    trailer = _CRC.pack(crc)
+    if compress:
+        # trailer 放在壓縮串流之外，讀取端可先驗證再使用
+        yield chunk
+        yield trailer
+    else:
+        yield chunk + trailer
+
+
+class _Reader:
+    """從 file-like 物件逐塊讀取 (必要時解壓縮)，不需要一次讀入整個檔案"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._buffer = b''
+        self._pos = 0
+        self._strings = []
+        self.crc = 0
+
+        header = self._read_raw(6)
+        if len(header) < 6 or header[:4] != MAGIC:
+            raise SnapshotError("not a rule snapshot")
+        if header[4] != VERSION:
+            raise SnapshotError(f"unsupported snapshot version {header[4]}")
+        if header[5] & ~_KNOWN_FLAGS:
+            raise SnapshotError(f"unsupported snapshot flags {header[5]:#x}")
+        self.flags = header[5]
+        self._decompressor = zlib.decompressobj() if header[5] & FLAG_COMPRESSED else None
+        self._tail = b''
+
+    def _read_raw(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self._stream.read(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def _decompress(self, raw):
+        # 損毀的壓縮本文 (錯誤的區塊、Adler-32 不符) 一律視為快照格式錯誤
+        try:
+            data = self._decompressor.decompress(raw)
+        except zlib.error as e:
+            raise SnapshotError(f"corrupt compressed body: {e}")
+        # 壓縮串流結束後的位元組即為 trailer
+        self._tail += self._decompressor.unused_data
+        return data
+
+    def _fill(self, size):
+        while len(self._buffer) - self._pos < size:
+            if self._decompressor is not None and self._decompressor.eof:
+                raise SnapshotError("unexpected end of snapshot")
+            raw = self._stream.read(_CHUNK_SIZE)
+            if not raw:
+                raise SnapshotError("unexpected end of snapshot")
+            if self._decompressor is not None:
+                raw = self._decompress(raw)
+            # 已讀取的部分在丟棄前計入 CRC
+            self.crc = zlib.crc32(self._buffer[:self._pos], self.crc)
+            self._buffer = self._buffer[self._pos:] + raw
+            self._pos = 0
+
+    def read(self, size):
+        self._fill(size)
+        data = self._buffer[self._pos:self._pos + size]
+        self._pos += size
+        return data
+
+    def varint(self):
+        # 絕大多數的值 (字串參照、長度、排序) 都是單一位元組
+        pos = self._pos
+        if pos < len(self._buffer) and self._buffer[pos] < 0x80:
+            self._pos = pos + 1
+            return self._buffer[pos]
+        result = shift = 0
+        while True:
+            byte = self.read(1)[0]
+            result |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return result
+            shift += 7
+            if shift > 63:
+                raise SnapshotError("varint too long")
+
+    def signed(self):
+        value = self.varint()
+        return (value >> 1) ^ -(value & 1)
+
+    def string(self):
+        ref = self.varint()
+        if ref == 0:
+            return None
+        if ref == 1:
+            length = self.varint()
+            if length > MAX_STRING_BYTES:
+                raise SnapshotError("string too long")
+            try:
+                value = self.read(length).decode('utf-8')
+            except UnicodeDecodeError:
+                raise SnapshotError("invalid UTF-8 string")
+            self._strings.append(value)
+            return value
+        try:
+            return self._strings[ref - 2]
+        except IndexError:
+            raise SnapshotError("invalid string reference")
+
+    def verify(self):
+        """讀完本文後比對 CRC32"""
+        expected = zlib.crc32(self._buffer[:self._pos], self.crc)
+        if self._decompressor is not None:
+            while not self._decompressor.eof:
+                raw = self._stream.read(_CHUNK_SIZE)
+                if not raw:
+                    raise SnapshotError("unexpected end of snapshot")
+                if self._decompress(raw):
+                    raise SnapshotError("trailing data after nodes")
+            if self._pos != len(self._buffer):
+                raise SnapshotError("trailing data after nodes")
+            tail = self._tail + self._read_raw(_CRC.size - len(self._tail))
+        else:
+            tail = self._buffer[self._pos:] + self._read_raw(_CRC.size - (len(self._buffer) - self._pos))
+        if len(tail) != _CRC.size or _CRC.unpack(tail)[0] != expected:
+            raise SnapshotError("snapshot checksum mismatch")
+
+
+def read_snapshot(stream, max_nodes=None):
+    """
+    解碼快照，回傳 (SnapshotRule, [SnapshotNode, ...])。
+    節點 id 為原始 id (快照保留 id 時) 或快照中的位置 + 1 (保留原始 id 的相對順序)，rule_id 為匯出時的規則 id。
+    """
+    r = _Reader(stream)
+    rule = SnapshotRule(
+        id=r.varint(),
+        name=r.string(),
+        total_length=r.signed(),
+        is_active=r.read(1) != b'\x00',
+        revision=r.varint()
+    )
+    count = r.varint()
+    if max_nodes is not None and count > max_nodes:
+        raise SnapshotError(f"too many nodes: {count} (max {max_nodes})")
+
+    include_ids = r.flags & FLAG_NODE_IDS
+    ids = []
+    parents = []
+    nodes = []
+    for i in range(count):
+        ids.append((ids[-1] if ids else 0) + r.varint() if include_ids else i + 1)
+        parent = r.varint()
+        if parent > count:
+            raise SnapshotError(f"node {i + 1}: invalid parent reference")
+        parents.append(parent)
+        nodes.append(SnapshotNode(
+            id=ids[i],
+            rule_id=rule.id,
+            parent_id=None,
+            name=r.string(),
+            node_type=r.string(),
+            segment_length=r.signed(),
+            code=r.string(),
+            value_regex=r.string(),
+            value_placeholder=r.string(),
+            description=r.string(),
+            sort_order=r.signed()
+        ))
+    r.verify()
+    # 父節點可能排在子節點之後 (節點曾被移動)，全部讀完後再換成 id
+    nodes = [n._replace(parent_id=ids[p - 1]) if p else n for n, p in zip(nodes, parents)]
+    return rule, nodes
+
+
+def snapshot_to_import_nodes(nodes):
+    """轉成 rule_import.validate_import 使用的平面節點列表 (以快照位置作為用戶端 id)"""
+    return [{
+        "id": str(n.id),
+        "parent_id": str(n.parent_id) if n.parent_id else None,
+        "name": n.name,
+        "node_type": n.node_type,
+        "segment_length": n.segment_length,
+        "code": n.code,
+        "value_regex": n.value_regex,
+        "value_placeholder": n.value_placeholder,
+        "sort_order": n.sort_order,
+        "description": n.description
+    } for n in nodes]
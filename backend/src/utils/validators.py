@@ -12,4 +12,16 @@ def validate_password_strength(password):
         return False
     if not re.search(r"[A-Z]", password):
         return False
-    return True
\ No newline at end of file
+    return True
+
+def validate_regex(pattern):
+    """
+    驗證節點的 value_regex 是否為合法的正規表示式 (建立節點時檢查，避免解碼時才出錯)
+    """
+    if not isinstance(pattern, str):
+        return False
+    try:
+        re.compile(pattern)
+    except re.error:
+        return False
+    return True
@@ -35,6 +35,16 @@ export const authService = {
     });
   },
 
+  /**
+   * 管理員再驗證 (sudo)：有效期內刪除節點、管理使用者等操作不需再輸入密碼
+   */
+  async sudo(currentPassword: string): Promise<{ message: string; data: { sudo_expires_at: string } }> {
+    return request('/auth/sudo', {
+      method: 'POST',
+      body: JSON.stringify({ current_password: currentPassword }),
+    });
+  },
+
   async forgotPassword(username: string): Promise<void> {
     await request('/auth/forgot-password', {
       method: 'POST',
@@ -1,5 +1,5 @@
 import { request } from '@/lib/api';
-import type { CodingNode, CodingRule } from '@/types/rules';
+import type { CodingNode, CodingRule, CodingRuleTree, CodingRuleVersion, CodingTreeNode } from '@/types/rules';
 
 interface NodesResponse {
   data: CodingNode[];
@@ -25,6 +25,26 @@ export interface DecodeSegment {
   type: string;
 }
 
+export interface CompletionSuggestion {
+  rule_id: number;
+  node_id: number;
+  node_name: string;
+  type: string;
+  value: string;
+  meaning: string;
+  is_placeholder: boolean;
+  segment_length: number;
+  offset: number;
+}
+
+export interface NodeMove {
+  node_id: number;
+  /** 省略表示不換父節點，null 表示移到最上層 */
+  parent_id?: number | null;
+  /** 在新兄弟節點中的目標位置，省略表示排到最後 */
+  sort_order?: number;
+}
+
 export const rulesService = {
   getRules: () => request<{ data: CodingRule[] }>('/coding-rules'),
   
@@ -45,6 +65,38 @@ export const rulesService = {
     return request<NodesResponse>(endpoint);
   },
 
+  /**
+   * 一次取得整棵規則樹 (可用 depth 限制層數)
+   */
+  getTree: (ruleId: number, depth?: number) => {
+    const endpoint = depth
+      ? `/coding-rules/${ruleId}/tree?depth=${depth}`
+      : `/coding-rules/${ruleId}/tree`;
+    return request<{ data: CodingRuleTree }>(endpoint);
+  },
+
+  /**
+   * 取得某節點 (含) 以下的整棵子樹與子孫數量
+   */
+  getSubtree: (nodeId: number, depth?: number) => {
+    const endpoint = depth !== undefined
+      ? `/coding-rules/nodes/${nodeId}/subtree?depth=${depth}`
+      : `/coding-rules/nodes/${nodeId}/subtree`;
+    return request<{ data: CodingTreeNode; descendant_count: number }>(endpoint);
+  },
+
+  /**
+   * 將目前的草稿凍結為新的發佈版本 (草稿未變動時回傳既有版本)
+   */
+  publish: (ruleId: number) => {
+    return request<{ message: string; data: CodingRuleVersion }>(`/coding-rules/${ruleId}/publish`, {
+      method: 'POST'
+    });
+  },
+
+  getVersions: (ruleId: number) =>
+    request<{ published_version: number | null; data: CodingRuleVersion[] }>(`/coding-rules/${ruleId}/versions`),
+
   createNode: (data: CreateNodePayload) => {
     return request<void>('/coding-rules/nodes', {
       method: 'POST',
@@ -52,18 +104,38 @@ export const rulesService = {
     });
   },
 
-  deleteNode: (nodeId: number, password: string) => {
+  /**
+   * 批次移動 / 重新排序節點，受影響的層級會重新編號為連續的 0..n-1
+   */
+  moveNodes: (ruleId: number, moves: NodeMove[]) => {
+    return request<{ message: string; updated: number }>(`/coding-rules/${ruleId}/nodes/move`, {
+      method: 'POST',
+      body: JSON.stringify({ moves })
+    });
+  },
+
+  deleteNode: (nodeId: number, password?: string) => {
+    // 在 sudo 再驗證有效期內可省略 password
     // 假設後端有實作 DELETE /coding-rules/nodes/:id
-    return request<void>(`/coding-rules/nodes/${nodeId}`, { 
+    return request<{ message: string; deleted: number }>(`/coding-rules/nodes/${nodeId}`, { 
       method: 'DELETE',
       body: JSON.stringify({ current_password: password })
     });
   },
 
-  decode: (code: string) => {
+  /**
+   * 依已輸入的部分代碼取得可能的下一個片段 (自動完成)
+   */
+  complete: (prefix: string, ruleId?: number) => {
+    const params = new URLSearchParams({ prefix });
+    if (ruleId) params.set('rule_id', String(ruleId));
+    return request<{ data: CompletionSuggestion[] }>(`/coding-rules/complete?${params}`);
+  },
+
+  decode: (code: string, ruleId?: number) => {
     return request<{ data: DecodeSegment[] }>('/coding-rules/decode', {
       method: 'POST',
-      body: JSON.stringify({ code })
+      body: JSON.stringify(ruleId ? { code, rule_id: ruleId } : { code })
     });
   },
 };
\ No newline at end of file
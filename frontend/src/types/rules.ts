@@ -5,6 +5,18 @@ export interface CodingRule {
   name: string;
   total_length: number;
   is_active: boolean;
+  revision?: number;
+  /** 最新的發佈版本，null 代表尚未發佈 (解碼使用草稿) */
+  published_version?: number | null;
+}
+
+export interface CodingRuleVersion {
+  rule_id: number;
+  version: number;
+  node_count: number;
+  draft_revision: number;
+  published_at: string | null;
+  published_by: number | null;
 }
 
 export interface CodingNode {
@@ -20,4 +32,14 @@ export interface CodingNode {
   sort_order: number;
   description: string | null;
   has_children: boolean;
+  child_count?: number;
+  option_count?: number;
+}
+
+export interface CodingTreeNode extends CodingNode {
+  children: CodingTreeNode[];
+}
+
+export interface CodingRuleTree extends CodingRule {
+  nodes: CodingTreeNode[];
 }